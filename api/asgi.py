@@ -0,0 +1,169 @@
+"""Asyncio (ASGI) entry point serving the same menus and callbacks as the Flask app.
+
+Screens, keyboards, routing, update handlers, dedup, rate limiting and metrics all come
+from index.py; only the transport and the Bot API client differ. Bot API calls go through
+telebot's aiohttp-based client, which keeps one pooled connector per event loop, so a
+single process can hold hundreds of updates in flight while they wait on Telegram.
+Needs aiohttp and an ASGI server (pip install -r requirements-async.txt):
+
+    uvicorn asgi:app --app-dir api
+"""
+import asyncio
+import os
+import time
+
+import telebot
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+import index
+from index import (
+    FAST_ACK, TELEGRAM_API_URL, TOKEN, WEBHOOK_SECRET, API_SECONDS, MemoryDedupStore, dedup_store,
+    extract_update_id, handle_update, logger, send_scheduler, upload_streams, webhook_state,
+)
+
+if TELEGRAM_API_URL:
+    asyncio_helper.API_URL = TELEGRAM_API_URL
+# Size of the shared aiohttp connection pool.
+asyncio_helper.REQUEST_LIMIT = int(os.environ.get('ASYNC_POOL_SIZE', '100'))
+
+abot = AsyncTeleBot(TOKEN)
+
+# Same interception point as the sync client: every async Bot API call is timed and
+# passes through the shared send scheduler.
+_process_request = asyncio_helper._process_request
+
+
+async def _scheduled_process_request(token, url, method='get', params=None, files=None, **kwargs):
+    streams = upload_streams(files)
+
+    async def send():
+        for stream, offset in streams:
+            stream.seek(offset)
+        start_time = time.perf_counter()
+        try:
+            return await _process_request(token, url, method, dict(params) if params else params, files, **kwargs)
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start_time, url)
+    return await send_scheduler.acall(send, params.get('chat_id') if params else None, asyncio_helper.ApiTelegramException)
+
+
+asyncio_helper._process_request = _scheduled_process_request
+
+
+# --- Bot API Client ---
+class AsyncClient:
+    """index.SyncClient's interface over AsyncTeleBot, for running the shared handlers on the loop."""
+
+    api_error = asyncio_helper.ApiTelegramException
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def call(self, method, *args, **kwargs):
+        return await getattr(self.bot, method)(*args, **kwargs)
+
+    def start(self, method, *args, **kwargs):
+        return asyncio.ensure_future(getattr(self.bot, method)(*args, **kwargs))
+
+    async def wait(self, pending):
+        return await pending
+
+    async def run_blocking(self, function, *args):
+        # Runs in a worker thread; the context (log fields, send ticket) is copied along.
+        return await asyncio.to_thread(function, *args)
+
+    async def process_other(self, update):
+        await self.bot.process_new_updates([update])
+
+
+async_client = AsyncClient(abot)
+
+
+# --- ASGI Application ---
+# In fast-ack mode updates run as background tasks; beyond this many in flight, new ones
+# are rejected with 503 so Telegram redelivers them later.
+_MAX_IN_FLIGHT = int(os.environ.get('FAST_ACK_QUEUE_SIZE', '256'))
+_in_flight = set()
+
+
+async def _respond(send, status, body, content_type='text/plain; charset=utf-8'):
+    body = body.encode('utf-8') if isinstance(body, str) else body
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', content_type.encode('ascii'))]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        event = await receive()
+        chunks.append(event.get('body', b''))
+        if not event.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _dedup(method, update_id):
+    # The in-memory store is a dict lookup; any other backend may touch disk or the network.
+    if isinstance(dedup_store, MemoryDedupStore):
+        return method(update_id)
+    return await asyncio.to_thread(method, update_id)
+
+
+async def _run_update(update):
+    try:
+        await handle_update(async_client, update)
+    except Exception as e:
+        logger.error("An error occurred in webhook handler: %s", e)
+        webhook_state.invalidate("webhook handler error")
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            event = await receive()
+            if event['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif event['type'] == 'lifespan.shutdown':
+                await abot.close_session()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    path, method = scope['path'], scope['method']
+    if path == '/metrics':
+        body, status, headers = index.metrics()
+        return await _respond(send, status, body, headers['Content-Type'])
+    if path != '/':
+        return await _respond(send, 404, "Not Found")
+    if method == 'GET':
+        await asyncio.to_thread(webhook_state.ensure)
+        return await _respond(send, 200, "Bot is running!")
+    if method != 'POST':
+        return await _respond(send, 405, "Method Not Allowed")
+
+    headers = dict(scope['headers'])
+    if headers.get(b'x-telegram-bot-api-secret-token', b'').decode('latin-1') != WEBHOOK_SECRET:
+        return await _respond(send, 401, "Unauthorized")
+    if not webhook_state.confirm():
+        await asyncio.to_thread(webhook_state.ensure)
+    raw_data = await _read_body(receive)
+    update_id = extract_update_id(raw_data)
+    if update_id is not None and not await _dedup(dedup_store.add, update_id):
+        logger.info("[Webhook Handler] Duplicate update %s skipped.", update_id)
+        return await _respond(send, 200, "OK")
+    try:
+        update = telebot.types.Update.de_json(raw_data.decode('utf-8'))
+    except Exception as e:
+        logger.error("An error occurred in webhook handler: %s", e)
+        return await _respond(send, 200, "OK")
+    if FAST_ACK:
+        if len(_in_flight) >= _MAX_IN_FLIGHT:
+            await _dedup(dedup_store.discard, update_id)
+            return await _respond(send, 503, "Busy")
+        task = asyncio.ensure_future(_run_update(update))
+        _in_flight.add(task)
+        task.add_done_callback(_in_flight.discard)
+        return await _respond(send, 200, "OK")
+    await _run_update(update)
+    return await _respond(send, 200, "OK")
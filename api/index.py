@@ -1,445 +1,2076 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import telebot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 import os
 from flask import Flask, request
-import time
 import json
+import bisect
+import logging
+import contextvars
+import hashlib
+from collections import namedtuple, OrderedDict
+from functools import partial
+import itertools
+from types import MappingProxyType
+import re
+import threading
+import atexit
+import queue
+import requests
+from requests.adapters import HTTPAdapter
 
 # --- Configuration ---
 # Load environment variables. These must be set in your Vercel project settings.
 TOKEN = os.environ.get('TELEGRAM_TOKEN')
 WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')
 PUBLIC_URL = os.environ.get('PUBLIC_URL')
+# Optional override of the Bot API endpoint, e.g. a local fake server for latency measurements.
+# Uses telebot's format: "http://127.0.0.1:8081/bot{0}/{1}".
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL')
+# Log verbosity and format. DEBUG enables full update dumps; LOG_FORMAT=text gives plain lines.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+# Number of threads used to run independent Bot API calls of one update in parallel.
+OUTBOUND_WORKERS = int(os.environ.get('OUTBOUND_WORKERS', '4'))
+# Worker threads draining the update queue in fast-ack mode.
+FAST_ACK_WORKERS = int(os.environ.get('FAST_ACK_WORKERS', '4'))
+# Threads serving webhook requests at once (e.g. gunicorn --threads); each may call the Bot API.
+REQUEST_THREADS = int(os.environ.get('REQUEST_THREADS', '16'))
+# Keep-alive connections to the Bot API. Every thread above may hold one; when more threads
+# call at once than the pool holds, urllib3 discards the extra connections after use.
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', str(REQUEST_THREADS + FAST_ACK_WORKERS + OUTBOUND_WORKERS)))
+# Menu, FAQ, contact and payment texts. Edits are picked up without a redeploy when the file
+# lives outside the bundle (e.g. a mounted volume); checked at most every CONTENT_CHECK_INTERVAL seconds.
+CONTENT_PATH = os.environ.get('CONTENT_PATH', os.path.join(os.path.dirname(__file__), 'content.json'))
+CONTENT_CHECK_INTERVAL = float(os.environ.get('CONTENT_CHECK_INTERVAL', '5'))
 
 # A fatal error will occur on Vercel if these are not set.
 if not TOKEN or not WEBHOOK_SECRET or not PUBLIC_URL:
     raise ValueError("FATAL ERROR: TELEGRAM_TOKEN, WEBHOOK_SECRET, and PUBLIC_URL environment variables must be set.")
 
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL
+
+
+# --- Logging ---
+# Fields of the update being handled; attached to every record logged while it is processed.
+_log_context = contextvars.ContextVar('log_context', default={})
+
+
+def set_log_context(**fields):
+    return _log_context.set({**_log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, carrying the update context and timings when present."""
+
+    FIELDS = ('update_id', 'chat_id', 'route', 'duration_ms')
+
+    def format(self, record):
+        entry = {'ts': round(record.created, 3), 'level': record.levelname, 'msg': record.getMessage()}
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter('%(levelname)s %(message)s'))
+_log_handler.addFilter(ContextFilter())
+logger = logging.getLogger('bot')
+logger.addHandler(_log_handler)
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+
+# One keep-alive connection pool shared by request threads, queue workers and outbound
+# threads, reused across requests for as long as the instance stays warm.
+_http_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+telebot.apihelper.session = requests.Session()
+telebot.apihelper.session.mount('https://', _http_adapter)
+telebot.apihelper.session.mount('http://', _http_adapter)
+
 bot = telebot.TeleBot(TOKEN)
 app = Flask(__name__)
 
 
+# --- Metrics ---
+class Histogram:
+    """Prometheus-style histogram with fixed buckets, optionally split by one label."""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = [(label_value, list(counts), total, count) for label_value, (counts, total, count) in self._series.items()]
+        for label_value, counts, total, count in series_items:
+            labels = f'{self.label}="{label_value}",' if self.label else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels}le="{le}"}} {cumulative}')
+            labels = f'{{{labels.rstrip(",")}}}' if labels else ''
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+UPDATE_SECONDS = Histogram('bot_update_duration_seconds', 'Total time spent handling one update.')
+ROUTE_SECONDS = Histogram('bot_callback_route_duration_seconds', 'Time spent handling a callback, by route.', label='route')
+API_SECONDS = Histogram('bot_api_request_duration_seconds', 'Time per outbound Bot API request, by method.', label='method')
+WEBHOOK_CHECK_SECONDS = Histogram('bot_webhook_check_duration_seconds', 'Time spent verifying the webhook with Telegram.')
+HISTOGRAMS = (UPDATE_SECONDS, ROUTE_SECONDS, API_SECONDS, WEBHOOK_CHECK_SECONDS)
+
+RATE_LIMIT_WAIT_SECONDS = Histogram('bot_rate_limit_wait_seconds', 'Time outbound calls waited for a rate-limit token.')
+HISTOGRAMS += (RATE_LIMIT_WAIT_SECONDS,)
+
+
+# --- Outbound Scheduler ---
+class Superseded(Exception):
+    """Raised instead of sending a screen that a newer click in the same chat has replaced."""
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now):
+        """How long until a whole token is available; 0 if one is available now."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+# Ticket of the screen being rendered on this thread: (chat_id, generation).
+_send_ticket = contextvars.ContextVar('send_ticket', default=None)
+
+
+class SendScheduler:
+    """Keeps outbound calls within Telegram's global and per-chat message limits.
+
+    Calls addressed to a chat take a token from the global bucket and from that chat's
+    bucket, waiting while either is empty. Navigation in a chat takes a ticket via begin();
+    if a newer click in the same chat starts before the call goes out, the older screen
+    is dropped with Superseded so only the latest one is sent. A call takes its tokens only
+    once it can send and is still current, and begin() wakes the chat's waiting calls, so
+    a dropped screen neither uses capacity nor delays the latest one. 429 responses are
+    retried after their retry_after, doubled on each further attempt.
+    """
+
+    def __init__(self, global_rate, chat_rate, chat_burst, max_retries, max_retry_after, max_chats=10000):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = OrderedDict()
+        # Latest generation per chat, evicted least-recently-clicked first. Generations come
+        # from one process-wide counter, so a number is never handed out twice, even to a
+        # chat that was evicted and clicks again.
+        self._generations = OrderedDict()
+        self._next_generation = itertools.count(1)
+        # Wake-up callbacks of calls waiting for a token, by chat.
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.retries = 0
+
+    def begin(self, chat_id):
+        with self._lock:
+            generation = next(self._next_generation)
+            self._generations[chat_id] = generation
+            self._generations.move_to_end(chat_id)
+            if len(self._generations) > self.max_chats:
+                self._generations.popitem(last=False)
+            waiters = self._waiters.pop(chat_id, ())
+        # Waiting calls re-check at once whether they were superseded.
+        for wake in waiters:
+            wake()
+        return _send_ticket.set((chat_id, generation))
+
+    def end(self, token):
+        # The chat's latest generation stays recorded: a click still in flight must keep
+        # seeing that it was superseded after the newer one finishes.
+        _send_ticket.reset(token)
+
+    def _admit(self, chat_id, wake):
+        """Take rate-limit tokens for chat_id, or raise Superseded if the screen is stale.
+
+        Returns 0 once the tokens are taken; otherwise how long until they may be, with
+        wake registered to be called if a newer click starts in the meantime.
+        """
+        ticket = _send_ticket.get()
+        now = time.monotonic()
+        with self._lock:
+            if ticket is not None and ticket[0] == chat_id and self._generations.get(chat_id, 0) > ticket[1]:
+                self.coalesced += 1
+                raise Superseded()
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+                if len(self._chats) > self.max_chats:
+                    self._chats.popitem(last=False)
+            else:
+                self._chats.move_to_end(chat_id)
+            wait = max(self._global.wait_time(now), bucket.wait_time(now))
+            if wait:
+                self._waiters.setdefault(chat_id, set()).add(wake)
+            else:
+                self._global.tokens -= 1
+                bucket.tokens -= 1
+            return wait
+
+    def _unwatch(self, chat_id, wake):
+        with self._lock:
+            waiters = self._waiters.get(chat_id)
+            if waiters is not None:
+                waiters.discard(wake)
+                if not waiters:
+                    del self._waiters[chat_id]
+
+    def _throttled(self, waited):
+        self.throttled += 1
+        RATE_LIMIT_WAIT_SECONDS.observe(waited)
+
+    def _acquire(self, chat_id):
+        start_time = None
+        while True:
+            woken = threading.Event()
+            wait = self._admit(chat_id, woken.set)
+            if not wait:
+                break
+            start_time = start_time or time.perf_counter()
+            try:
+                woken.wait(wait)
+            finally:
+                self._unwatch(chat_id, woken.set)
+        if start_time is not None:
+            self._throttled(time.perf_counter() - start_time)
+
+    async def _aacquire(self, chat_id):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        start_time = None
+        while True:
+            woken = loop.create_future()
+            # begin() may run on another thread, so the future is resolved on its own loop.
+            wake = partial(loop.call_soon_threadsafe, _resolve, woken)
+            wait = self._admit(chat_id, wake)
+            if not wait:
+                break
+            start_time = start_time or time.perf_counter()
+            try:
+                await asyncio.wait((woken,), timeout=wait)
+            finally:
+                self._unwatch(chat_id, wake)
+        if start_time is not None:
+            self._throttled(time.perf_counter() - start_time)
+
+    def _retry_delay(self, error, attempt):
+        """Delay before retrying a failed call, or None if the error should propagate."""
+        if getattr(error, 'error_code', None) != 429 or attempt == self.max_retries:
+            return None
+        parameters = (error.result_json or {}).get('parameters') or {}
+        delay = min(parameters.get('retry_after', 1) * (2 ** attempt), self.max_retry_after)
+        self.rate_limited += 1
+        self.retries += 1
+        logger.warning("[Send Scheduler] 429 on %s, retrying in %s s.", error.function_name, delay)
+        return delay
+
+    def call(self, send, chat_id):
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                self._acquire(chat_id)
+            try:
+                return send()
+            except telebot.apihelper.ApiTelegramException as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def acall(self, send, chat_id, error_type):
+        """Same as call() for coroutine-based clients; error_type is the client's API error class."""
+        import asyncio
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                await self._aacquire(chat_id)
+            try:
+                return await send()
+            except error_type as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            'throttled': self.throttled,
+            'coalesced': self.coalesced,
+            'rate_limited': self.rate_limited,
+            'retries': self.retries,
+        }
+
+
+send_scheduler = SendScheduler(
+    global_rate=float(os.environ.get('RATE_LIMIT_GLOBAL', '30')),
+    chat_rate=float(os.environ.get('RATE_LIMIT_CHAT', '1')),
+    chat_burst=float(os.environ.get('RATE_LIMIT_CHAT_BURST', '3')),
+    max_retries=int(os.environ.get('RATE_LIMIT_MAX_RETRIES', '3')),
+    max_retry_after=float(os.environ.get('RATE_LIMIT_MAX_RETRY_AFTER', '10')),
+)
+
+# Every Bot API call made by telebot goes through apihelper._make_request, so scheduling and
+# timing it there covers all outbound methods without touching the call sites.
+_make_request = telebot.apihelper._make_request
+
+
+def upload_streams(files):
+    """File objects in a Bot API files dict with their current offsets.
+
+    A retried upload must start from the same offset again: after the first attempt the
+    stream is at EOF and would send an empty file.
+    """
+    streams = []
+    for value in (files or {}).values():
+        if isinstance(value, tuple):
+            value = value[-1]
+        value = getattr(value, 'file', value)  # telebot.types.InputFile
+        if hasattr(value, 'seek') and hasattr(value, 'tell'):
+            streams.append((value, value.tell()))
+    return streams
+
+
+def _scheduled_make_request(token, method_name, method='get', params=None, files=None):
+    streams = upload_streams(files)
+
+    def send():
+        for stream, offset in streams:
+            stream.seek(offset)
+        start_time = time.perf_counter()
+        try:
+            # telebot pops 'timeout' out of params, so each attempt gets its own copy.
+            return _make_request(token, method_name, method, dict(params) if params else params, files)
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start_time, method_name)
+    return send_scheduler.call(send, params.get('chat_id') if params else None)
+
+
+telebot.apihelper._make_request = _scheduled_make_request
+
+
 # --- Bot Logic (Menus and Handlers from your original file) ---
 
-# Главное меню
-def main_menu():
-    markup = InlineKeyboardMarkup(row_width=2)
-    video_button = InlineKeyboardButton("📹 Видеоматериалы", callback_data='video_menu')
-    contacts_button = InlineKeyboardButton("📞 Контакты", callback_data='contacts_menu')
-    request_button = InlineKeyboardButton("✍️ Оставить заявку", callback_data='make_request')
-    reviews_button = InlineKeyboardButton("💬 Отзывы", callback_data='reviews_menu')
-    faq_button = InlineKeyboardButton("❓ Частые вопросы", callback_data='faq_menu')
-    price_button = InlineKeyboardButton("💰 Прайс", callback_data='show_price')
-    reserve_button = InlineKeyboardButton("🔒 Резерв", callback_data='reserve')
-    markup.add(video_button)
-    markup.add(contacts_button, request_button)
-    markup.add(reviews_button, faq_button)
-    markup.add(price_button, reserve_button)
-    return markup
+# Кэш клавиатур: каждая строится и сериализуется в JSON один раз, а в send_message
+# передаётся уже готовая строка. Сами клавиатуры описаны в content.json.
+class KeyboardCache:
+    def __init__(self):
+        self._factories = {}
+        self._cache = {}
 
-# Меню видеоматериалов
-def video_menu():
-    markup = InlineKeyboardMarkup(row_width=1)
-    for i in range(1, 6):
-        markup.add(InlineKeyboardButton(f"Ссылка {i}", callback_data=f'video_link_{i}'))
-    markup.add(InlineKeyboardButton("⬅️ Назад", callback_data='back_to_main'))
-    return markup
+    def register(self, factory, name=None):
+        name = name or factory.__name__
+        self._factories[name] = factory
+        self._cache.pop(name, None)
+        return factory
 
-# Меню контактов
-def contacts_menu():
-    markup = InlineKeyboardMarkup(row_width=1)
-    markup.add(InlineKeyboardButton("📍 Наш адрес", callback_data='contact_address'))
-    markup.add(InlineKeyboardButton("📧 Email", callback_data='contact_email'))
-    markup.add(InlineKeyboardButton("📱 Телефон", callback_data='contact_phone'))
-    markup.add(InlineKeyboardButton("💬 Telegram", callback_data='contact_telegram'))
-    markup.add(InlineKeyboardButton("🌐 Сайт", callback_data='contact_website'))
-    markup.add(InlineKeyboardButton("⬅️ Назад", callback_data='back_to_main'))
-    return markup
+    def __getitem__(self, name):
+        payload = self._cache.get(name)
+        if payload is None:
+            payload = self._factories[name]().to_json()
+            self._cache[name] = payload
+        return payload
 
-# Меню деталей контакта с кнопкой "назад" в меню контактов
-def contact_detail_menu():
-    markup = InlineKeyboardMarkup(row_width=1)
-    markup.add(InlineKeyboardButton("⬅️ Назад", callback_data='back_to_contacts_menu'))
-    return markup
+    def invalidate(self, name=None):
+        """Drop one cached keyboard (or all of them) so it is rebuilt on next use."""
+        if name is None:
+            self._cache = {}
+        else:
+            self._cache.pop(name, None)
 
-# Меню отзывов
-def reviews_menu():
-    markup = InlineKeyboardMarkup(row_width=1)
-    for i in range(1, 6):
-        markup.add(InlineKeyboardButton(f"Отзыв {i}", callback_data=f'review_link_{i}'))
-    markup.add(InlineKeyboardButton("⬅️ Назад", callback_data='back_to_main'))
-    return markup
 
-# Меню частых вопросов
-def faq_menu():
-    markup = InlineKeyboardMarkup(row_width=1)
-    questions = ["Как сделать заказ?", "Какие способы оплаты?", "Сколько идет доставка?", "Как вернуть товар?", "Есть ли скидки?"]
-    for i, question in enumerate(questions, 1):
-        markup.add(InlineKeyboardButton(f"Вопрос {i}: {question}", callback_data=f'faq_question_{i}'))
-    markup.add(InlineKeyboardButton("⬅️ Назад", callback_data='back_to_main'))
-    return markup
+keyboards = KeyboardCache()
 
-# Меню оплаты
-def payment_menu():
-    markup = InlineKeyboardMarkup(row_width=2)
-    markup.add(InlineKeyboardButton("💳 СБП (по номеру)", callback_data='payment_sbp'), InlineKeyboardButton("💳 Банковская карта", callback_data='payment_card'))
-    markup.add(InlineKeyboardButton("⬅️ Назад", callback_data='back_to_main'))
-    return markup
 
-# Меню прайс-листа с кнопкой "назад"
-def price_menu():
-    markup = InlineKeyboardMarkup(row_width=1)
-    markup.add(InlineKeyboardButton("⬅️ Назад", callback_data='back_to_main_from_price'))
+# Собирает разметку из описания кнопок: список рядов, в каждом кнопки с callback_data или url
+def build_markup(rows):
+    markup = InlineKeyboardMarkup()
+    for row in rows:
+        markup.row(*[
+            InlineKeyboardButton(button['text'], callback_data=button.get('callback_data'), url=button.get('url'))
+            for button in row
+        ])
     return markup
 
+# Пул потоков для параллельных вызовов Bot API создаётся при первом нажатии кнопки,
+# а не при импорте, чтобы не замедлять холодный старт.
+_outbound = None
+_outbound_lock = threading.Lock()
+
+
+def get_outbound():
+    global _outbound
+    if _outbound is None:
+        with _outbound_lock:
+            if _outbound is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _outbound = ThreadPoolExecutor(max_workers=OUTBOUND_WORKERS, thread_name_prefix='outbound')
+    return _outbound
+
+
+# --- Bot API Clients ---
+class SyncClient:
+    """Blocking Bot API client behind the interface the update handlers await.
+
+    The handlers below are written once as coroutines and take a client: this one for
+    the Flask app and worker threads, AsyncClient in asgi.py for the event loop. None of
+    these methods ever suspends, so run_sync() drives a handler to completion in the
+    calling thread.
+    """
+
+    api_error = telebot.apihelper.ApiTelegramException
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def call(self, method, *args, **kwargs):
+        return getattr(self.bot, method)(*args, **kwargs)
+
+    def start(self, method, *args, **kwargs):
+        """Start a call alongside the rest of the handler; pass the result to wait()."""
+        return get_outbound().submit(getattr(self.bot, method), *args, **kwargs)
+
+    async def wait(self, pending):
+        return pending.result()
+
+    async def run_blocking(self, function, *args):
+        return function(*args)
+
+    async def process_other(self, update):
+        self.bot.process_new_updates([update])
+
+
+def run_sync(coroutine):
+    """Run a handler coroutine that only awaits a SyncClient, returning its result."""
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError("Handler suspended under run_sync(); it must only await a SyncClient.")
+
+
+sync_client = SyncClient(bot)
+
+
 # Обработчик команды /start
-@bot.message_handler(commands=['start'])
-def send_welcome(message):
-    print(f"[Handler] Received /start command from chat ID: {message.chat.id}")
+async def send_welcome(client, message):
+    logger.info("[Handler] Received /start command from chat ID: %s", message.chat.id)
     try:
-        bot.send_message(message.chat.id, "👋 Добро пожаловать! Выберите интересующий раздел:", reply_markup=main_menu())
-        print(f"[Handler] Sent welcome message to chat ID: {message.chat.id}")
+        await refresh_content(client)
+        screen = content.message('start')
+        await client.call('send_message', message.chat.id, screen.text, parse_mode=screen.parse_mode, reply_markup=screen.reply_markup)
+        logger.info("[Handler] Sent welcome message to chat ID: %s", message.chat.id)
     except Exception as e:
-        print(f"[Handler] Error sending welcome message to chat ID {message.chat.id}: {e}")
+        logger.error("[Handler] Error sending welcome message to chat ID %s: %s", message.chat.id, e)
+
+# Перечитывает content.json, только когда подошёл срок проверки: чтение файла идёт вне цикла событий
+async def refresh_content(client):
+    if content.due():
+        await client.run_blocking(content.refresh)
 
 # Вспомогательная функция для удаления предыдущего сообщения
-def delete_previous_message(chat_id, message_id, context=""):
+async def delete_previous_message(client, chat_id, message_id, context=""):
     try:
-        bot.delete_message(chat_id, message_id)
-        print(f"[Message Deletion] Successfully deleted message {message_id} in chat {chat_id} ({context}).")
+        await client.call('delete_message', chat_id, message_id)
+        logger.debug("[Message Deletion] Successfully deleted message %s in chat %s (%s).", message_id, chat_id, context)
+    except Superseded:
+        raise
     except Exception as e:
-        print(f"[Message Deletion] Failed to delete message {message_id} in chat {chat_id} ({context}): {e}")
+        logger.warning("[Message Deletion] Failed to delete message %s in chat %s (%s): %s", message_id, chat_id, context, e)
 
-# Обработчик callback-кнопок
-@bot.callback_query_handler(func=lambda call: True)
-def handle_callback(call):
-    try:
-        # Главное меню
-        if call.data == 'video_menu':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "video_menu")
-            time.sleep(0.1)
-            
-            bot.send_message(
-                call.message.chat.id,
-                "📹 Видеоматериалы:",
-                reply_markup=video_menu()
-            )
-        
-        # Контакты
-        elif call.data == 'contacts_menu':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "contacts_menu")
-            time.sleep(0.1)
-            
-            bot.send_message(
-                call.message.chat.id,
-                "📞 Наши контакты:",
-                reply_markup=contacts_menu()
-            )
-        
-        # Оставить заявку
-        elif call.data == 'make_request':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "make_request")
-            time.sleep(0.1)
-            
-            bot.send_message(
-                call.message.chat.id,
-                "✍️ Для оформления заявки на консультацию, пожалуйста, выберите способ оплаты:",
-                reply_markup=payment_menu()
+# --- Pluggable Stores ---
+def load_backend(spec, builtins):
+    """Resolve a store chosen in config: a built-in name or 'package.module:factory'."""
+    if spec in builtins:
+        return builtins[spec]
+    module_name, _, attribute = spec.partition(':')
+    if not module_name or not attribute:
+        raise ValueError(f"Unknown store '{spec}': use one of {', '.join(builtins)} or 'package.module:factory'.")
+    import importlib
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+# --- Document Cache ---
+_file_digests = {}
+
+
+def file_digest(path):
+    """SHA-256 of a file's content, recomputed only when its mtime or size changes."""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _file_digests.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    _file_digests[path] = (signature, digest)
+    return digest
+
+
+class JsonFileIdStore:
+    """Persists content-hash -> Telegram file_id pairs in a small JSON file.
+
+    Any object with the same get/set methods can be passed to DocumentCache instead,
+    e.g. a shared key-value store for multi-instance deploys.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def get(self, key):
+        return self._load().get(key)
+
+    def set(self, key, value):
+        data = self._load()
+        data[key] = value
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("[Document Cache] Failed to persist file_id store %s: %s", self.path, e)
+
+
+class SqliteFileIdStore:
+    """Same interface as JsonFileIdStore, kept in an SQLite database.
+
+    Several worker processes on one host (or one mounted volume) can share the file safely.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, so each thread opens its own.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=5)
+            with connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS file_ids (digest TEXT PRIMARY KEY, file_id TEXT NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute('SELECT file_id FROM file_ids WHERE digest = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        try:
+            with self._connection() as connection:
+                connection.execute('INSERT OR REPLACE INTO file_ids (digest, file_id) VALUES (?, ?)', (key, value))
+        except Exception as e:
+            logger.warning("[Document Cache] Failed to persist file_id store %s: %s", self.path, e)
+
+
+class DocumentCache:
+    """Sends local documents by Telegram file_id, uploading each file version only once.
+
+    Files are keyed by the SHA-256 of their content; the digest is recomputed only when
+    the file's mtime or size changes, so an edited file triggers exactly one re-upload.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.hits = 0
+
+    def send(self, chat_id, path, **kwargs):
+        digest = file_digest(path)
+        file_id = self.store.get(digest)
+        if file_id:
+            try:
+                message = bot.send_document(chat_id, file_id, **kwargs)
+                self.hits += 1
+                return message
+            except telebot.apihelper.ApiTelegramException as e:
+                logger.warning("[Document Cache] Cached file_id for %s rejected, re-uploading: %s", path, e)
+        with self._lock:
+            # Another request may have uploaded this version while we waited.
+            cached_file_id = self.store.get(digest)
+            if cached_file_id and cached_file_id != file_id:
+                self.hits += 1
+                return bot.send_document(chat_id, cached_file_id, **kwargs)
+            with open(path, 'rb') as f:
+                message = bot.send_document(chat_id, f, **kwargs)
+            self.uploads += 1
+            self.store.set(digest, message.document.file_id)
+            return message
+
+
+PRICE_FILE_PATH = os.path.join(os.path.dirname(__file__), 'price.xlsx')
+# Where uploaded file_ids are remembered: 'json' (default), 'sqlite', or 'package.module:factory'
+# for a shared store such as Redis; the factory is called with FILE_ID_STORE_PATH and must return
+# an object with get/set. The default path is in /tmp, the only writable location on Vercel, which
+# lasts only as long as one warm instance: every cold start begins empty and re-uploads the price
+# list once. To keep file_ids across cold starts, point FILE_ID_STORE_PATH at durable storage
+# (a mounted volume; use 'sqlite' when several processes share it) or plug in a shared store.
+FILE_ID_STORE = os.environ.get('FILE_ID_STORE', 'json')
+FILE_ID_STORE_PATH = os.environ.get('FILE_ID_STORE_PATH', '/tmp/bot_file_ids.json')
+document_cache = DocumentCache(
+    load_backend(FILE_ID_STORE, {'json': JsonFileIdStore, 'sqlite': SqliteFileIdStore})(FILE_ID_STORE_PATH)
+)
+
+
+# --- Price Catalog ---
+PriceItem = namedtuple('PriceItem', 'name price category')
+
+
+class PriceCatalog:
+    """In-memory index of the price workbook, served as pre-rendered in-chat pages.
+
+    The workbook is parsed with a read-only (streaming) openpyxl load and rebuilt only
+    when its content digest changes. Every page, category and item screen is rendered
+    once per build, so serving one is a tuple lookup. Button labels come from the
+    content catalog; a new labels mapping re-renders the screens without re-parsing.
+    """
+
+    NAME_HEADERS = ('время', 'услуг', 'наимен', 'name')
+    PRICE_HEADERS = ('стоим', 'цена', 'price')
+    CATEGORY_HEADERS = ('катег', 'category')
+    # Telegram rejects keyboard rows of more than 8 buttons; category names are long, so keep rows short.
+    CATEGORIES_PER_ROW = 2
+    # Telegram's limit on message text; a category listing longer than this is split into pages.
+    MAX_TEXT_LENGTH = 4096
+
+    def __init__(self, path, page_size):
+        self.path = path
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._digest = None
+        self._labels = None
+        self.items = ()
+        self.categories = ()
+        self._pages = ()
+        self._category_screens = ()
+        self._item_screens = ()
+        self.builds = 0
+
+    def refresh(self, labels):
+        digest = file_digest(self.path)
+        if digest == self._digest and labels is self._labels:
+            return
+        with self._lock:
+            if digest == self._digest and labels is self._labels:
+                return
+            start_time = time.perf_counter()
+            self._build(self._read() if digest != self._digest else self.items, labels)
+            self._digest = digest
+            self._labels = labels
+            self.builds += 1
+            logger.info("[Price Catalog] Indexed %s items in %.1f ms.", len(self.items), (time.perf_counter() - start_time) * 1000)
+
+    def _find_column(self, header, candidates):
+        for index, title in enumerate(header):
+            if title and any(candidate in title for candidate in candidates):
+                return index
+        return None
+
+    def _read(self):
+        # openpyxl is only needed when the catalog is (re)built, so keep it off the import path.
+        import openpyxl
+        workbook = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+        items = []
+        try:
+            for sheet in workbook.worksheets:
+                header = None
+                for row in sheet.iter_rows(values_only=True):
+                    cells = [str(value).strip() if value is not None else '' for value in row]
+                    if header is None:
+                        # The first row with at least two filled cells is the header.
+                        if sum(1 for cell in cells if cell) >= 2:
+                            header = [cell.lower() for cell in cells]
+                            name_col = self._find_column(header, self.NAME_HEADERS)
+                            price_col = self._find_column(header, self.PRICE_HEADERS)
+                            category_col = self._find_column(header, self.CATEGORY_HEADERS)
+                            filled = [index for index, cell in enumerate(header) if cell]
+                            if name_col is None:
+                                name_col = filled[0]
+                            if price_col is None:
+                                price_col = next((index for index in filled if index != name_col), name_col)
+                            currency = ' руб.' if 'руб' in header[price_col] else ''
+                        continue
+                    name = cells[name_col] if name_col < len(cells) else ''
+                    if not name:
+                        continue
+                    value = row[price_col] if price_col < len(row) else None
+                    if isinstance(value, (int, float)):
+                        price = f"{value:,.0f}".replace(',', ' ') + currency
+                    else:
+                        price = cells[price_col] if price_col < len(cells) else ''
+                    category = cells[category_col] if category_col is not None and category_col < len(cells) else ''
+                    items.append(PriceItem(name, price, category or sheet.title))
+        finally:
+            workbook.close()
+        return tuple(items)
+
+    def _build(self, items, labels):
+        categories = tuple(dict.fromkeys(item.category for item in items))
+        page_count = max(1, -(-len(items) // self.page_size))
+
+        pages = []
+        for page in range(page_count):
+            markup = InlineKeyboardMarkup(row_width=1)
+            for index in range(page * self.page_size, min(len(items), (page + 1) * self.page_size)):
+                item = items[index]
+                markup.add(InlineKeyboardButton(f"{item.name} — {item.price}", callback_data=f'price_item_{index}'))
+            navigation = []
+            if page > 0:
+                navigation.append(InlineKeyboardButton(labels['price_previous'], callback_data=f'price_page_{page}'))
+            if page + 1 < page_count:
+                navigation.append(InlineKeyboardButton(labels['price_next'], callback_data=f'price_page_{page + 2}'))
+            if navigation:
+                markup.row(*navigation)
+            if len(categories) > 1:
+                for start in range(0, len(categories), self.CATEGORIES_PER_ROW):
+                    markup.row(*[
+                        InlineKeyboardButton(categories[i], callback_data=f'price_cat_{i}')
+                        for i in range(start, min(len(categories), start + self.CATEGORIES_PER_ROW))
+                    ])
+            markup.add(InlineKeyboardButton(labels['price_download'], callback_data='show_price'))
+            markup.add(InlineKeyboardButton(labels['price_back'], callback_data='back_to_main'))
+            pages.append(Screen(f"💰 Прайс-лист (стр. {page + 1}/{page_count}):", markup.to_json()))
+
+        category_screens = []
+        for number, category in enumerate(categories):
+            lines = [f"• {item.name} — {item.price}" for item in items if item.category == category]
+            chunks = self._paginate(lines, self.MAX_TEXT_LENGTH - len(f"💰 {category} (стр. 999/999):\n"))
+            screens = []
+            for page, chunk in enumerate(chunks):
+                title = f"💰 {category} (стр. {page + 1}/{len(chunks)}):" if len(chunks) > 1 else f"💰 {category}:"
+                markup = InlineKeyboardMarkup(row_width=1)
+                navigation = []
+                if page > 0:
+                    navigation.append(InlineKeyboardButton(labels['price_previous'], callback_data=f'price_cat_{number}_{page}'))
+                if page + 1 < len(chunks):
+                    navigation.append(InlineKeyboardButton(labels['price_next'], callback_data=f'price_cat_{number}_{page + 2}'))
+                if navigation:
+                    markup.row(*navigation)
+                markup.add(InlineKeyboardButton(labels['price_to_catalog'], callback_data='price_catalog'))
+                screens.append(Screen("\n".join([title] + chunk), markup.to_json()))
+            category_screens.append(tuple(screens))
+
+        item_screens = []
+        for index, item in enumerate(items):
+            markup = InlineKeyboardMarkup(row_width=1)
+            markup.add(InlineKeyboardButton(labels['price_request'], callback_data='make_request'))
+            markup.add(InlineKeyboardButton(labels['price_to_catalog'], callback_data=f'price_page_{index // self.page_size + 1}'))
+            text = f"💰 {item.name}\nСтоимость: {item.price}"
+            if len(text) > self.MAX_TEXT_LENGTH:
+                text = text[:self.MAX_TEXT_LENGTH - 1] + '…'
+            item_screens.append(Screen(text, markup.to_json()))
+
+        # Readers may run concurrently with a rebuild, so every attribute is swapped in whole.
+        self.items = items
+        self.categories = categories
+        self._pages = tuple(pages)
+        self._category_screens = tuple(category_screens)
+        self._item_screens = tuple(item_screens)
+
+    def page(self, number):
+        pages = self._pages
+        return pages[min(max(number, 1), len(pages)) - 1]
+
+    @staticmethod
+    def _paginate(lines, limit):
+        """Group lines into pages whose joined text fits in limit characters."""
+        pages = [[]]
+        length = 0
+        for line in lines:
+            if len(line) > limit:
+                line = line[:limit - 1] + '…'
+            if pages[-1] and length + 1 + len(line) > limit:
+                pages.append([])
+                length = 0
+            length += len(line) + (1 if pages[-1] else 0)
+            pages[-1].append(line)
+        return pages
+
+    def category(self, index, page=1):
+        screens = self._category_screens
+        if not 0 <= index < len(screens):
+            return None
+        pages = screens[index]
+        return pages[min(max(page, 1), len(pages)) - 1]
+
+    def item(self, index):
+        screens = self._item_screens
+        return screens[index] if 0 <= index < len(screens) else None
+
+
+price_catalog = PriceCatalog(PRICE_FILE_PATH, page_size=int(os.environ.get('PRICE_PAGE_SIZE', '8')))
+
+
+# --- Lead Capture ---
+class LeadIndex:
+    """Offsets of lead records by chat and by time, built incrementally from the segments.
+
+    Only bytes appended since the previous update are parsed, and queries read back just
+    the matching lines by seeking to their offsets.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._segments = []
+        self._scanned = []
+        self._by_chat = {}
+        self._times = []
+        self._by_time = []
+
+    def rename(self, old_path, new_path):
+        if old_path in self._segments:
+            self._segments[self._segments.index(old_path)] = new_path
+
+    def update(self, paths):
+        for path in paths:
+            if path not in self._segments:
+                self._segments.append(path)
+                self._scanned.append(0)
+            segment = self._segments.index(path)
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(self._scanned[segment])
+                    offset = self._scanned[segment]
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            break
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            record = None
+                        if record is not None:
+                            self._by_chat.setdefault(record.get('chat_id'), []).append((segment, offset))
+                            position = bisect.bisect_right(self._times, record.get('ts', 0))
+                            self._times.insert(position, record.get('ts', 0))
+                            self._by_time.insert(position, (segment, offset))
+                        offset += len(line)
+                    self._scanned[segment] = offset
+            except FileNotFoundError:
+                continue
+
+    def read(self, positions):
+        records = []
+        for segment, offset in positions:
+            with open(self._segments[segment], 'rb') as f:
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return records
+
+    def for_chat(self, chat_id):
+        return self.read(self._by_chat.get(chat_id, ()))
+
+    def since(self, ts):
+        return self.read(self._by_time[bisect.bisect_left(self._times, ts):])
+
+
+class LeadSink:
+    """Buffered, append-only JSONL store for captured leads.
+
+    append() only adds a line to an in-memory buffer; the buffer is written and fsynced
+    as one batch once it holds batch_size records, or when flush() is called. With
+    background=True a timer also flushes it flush_interval seconds after the first
+    append; that needs a long-running process. On Vercel the function is frozen after
+    the response and killed without atexit, so there the owner must flush() before
+    responding (handle_update does when the update left records pending). The active file is rotated to '<path>.<ms>.<n>'
+    past max_bytes, compact() merges rotated segments, and a torn last line left by a
+    crash is truncated before the next write.
+    """
+
+    def __init__(self, path, batch_size, flush_interval, max_bytes, background=False):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.background = background
+        self.index = LeadIndex()
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._recovered = False
+        self.flushes = 0
+
+    def append(self, record):
+        with self._lock:
+            self._buffer.append(json.dumps(record, ensure_ascii=False))
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+            elif self.background and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    @property
+    def pending(self):
+        """Number of buffered records not yet written."""
+        return len(self._buffer)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        if not self._recovered:
+            self._recover()
+        data = ('\n'.join(self._buffer) + '\n').encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._buffer = []
+        self.flushes += 1
+        if os.path.getsize(self.path) > self.max_bytes:
+            self._rotate()
+
+    def _recover(self):
+        self._recovered = True
+        try:
+            with open(self.path, 'rb+') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    return
+                f.seek(size - 1)
+                if f.read(1) == b'\n':
+                    return
+                # Find the end of the last complete record and drop the partial write after it.
+                position = size
+                while position > 0:
+                    step = min(4096, position)
+                    position -= step
+                    f.seek(position)
+                    newline = f.read(step).rfind(b'\n')
+                    if newline != -1:
+                        position += newline + 1
+                        break
+                f.truncate(position)
+                logger.warning("[Leads] Truncated a partial record at the end of %s (%s bytes).", self.path, size - position)
+        except FileNotFoundError:
+            pass
+
+    def _rotate(self):
+        self.index.update([self.path])
+        # Several rotations can happen within one millisecond; the sequence keeps them apart.
+        stamp = int(time.time() * 1000)
+        sequence = 0
+        while os.path.exists(f"{self.path}.{stamp}.{sequence}"):
+            sequence += 1
+        segment = f"{self.path}.{stamp}.{sequence}"
+        os.replace(self.path, segment)
+        self.index.rename(self.path, segment)
+        logger.info("[Leads] Rotated %s to %s.", self.path, segment)
+
+    def segments(self):
+        directory, name = os.path.split(self.path)
+        rotated = {}
+        for entry in os.listdir(directory or '.'):
+            if entry.startswith(name + '.'):
+                # '<ms>.<n>' suffixes sort by time, then sequence.
+                parts = entry[len(name) + 1:].split('.')
+                if all(part.isdigit() for part in parts):
+                    rotated[entry] = tuple(int(part) for part in parts)
+        return [os.path.join(directory, entry) for entry in sorted(rotated, key=rotated.get)] + [self.path]
+
+    def compact(self):
+        """Merge rotated segments into one, dropping unreadable lines and duplicate ids."""
+        with self._lock:
+            rotated = self.segments()[:-1]
+            if len(rotated) < 2:
+                return
+            seen = set()
+            tmp_path = f"{rotated[-1]}.tmp"
+            with open(tmp_path, 'wb') as out:
+                for segment in rotated:
+                    with open(segment, 'rb') as f:
+                        for line in f:
+                            try:
+                                record = json.loads(line)
+                            except ValueError:
+                                continue
+                            if record.get('id') in seen:
+                                continue
+                            seen.add(record.get('id'))
+                            out.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, rotated[-1])
+            for segment in rotated[:-1]:
+                os.remove(segment)
+            self.index.reset()
+
+    def _refresh_index(self):
+        with self._lock:
+            self._flush_locked()
+            self.index.update(self.segments())
+
+    def for_chat(self, chat_id):
+        self._refresh_index()
+        return self.index.for_chat(chat_id)
+
+    def since(self, ts):
+        self._refresh_index()
+        return self.index.since(ts)
+
+
+# Leads must outlive the instance, so LEADS_PATH has to point at durable storage (a mounted
+# volume); there is no default, since /tmp on Vercel is per-instance scratch space. Without it
+# lead capture is off.
+# Durability vs. latency: by default an update that captured a lead (a payment click) writes
+# and fsyncs it before the response, because a serverless instance may be frozen or killed
+# right after responding. That costs one fsync per payment click; other updates pay nothing.
+# LEADS_BACKGROUND_FLUSH=1 instead batches writes across updates (LEADS_BATCH_SIZE records or
+# LEADS_FLUSH_INTERVAL seconds) with a timer, so handlers never fsync, at the price of losing
+# the unflushed batch if the process dies. Only enable it for a long-running process
+# (e.g. gunicorn), like FAST_ACK.
+LEADS_PATH = os.environ.get('LEADS_PATH')
+if LEADS_PATH:
+    lead_sink = LeadSink(
+        LEADS_PATH,
+        batch_size=int(os.environ.get('LEADS_BATCH_SIZE', '20')),
+        flush_interval=float(os.environ.get('LEADS_FLUSH_INTERVAL', '5')),
+        max_bytes=int(os.environ.get('LEADS_MAX_BYTES', str(5 * 1024 * 1024))),
+        background=os.environ.get('LEADS_BACKGROUND_FLUSH', '').lower() in ('1', 'true', 'yes'),
+    )
+    atexit.register(lead_sink.flush)
+else:
+    lead_sink = None
+    logger.warning("[Leads] LEADS_PATH is not set; leads will not be stored.")
+
+
+# Сохраняет заявку пользователя с выбранным способом оплаты
+def record_lead(call, payment_method):
+    if lead_sink is None:
+        return
+    user = call.from_user
+    lead_sink.append({
+        'id': f"{call.message.chat.id}-{time.time_ns()}",
+        'ts': time.time(),
+        'chat_id': call.message.chat.id,
+        'user_id': user.id,
+        'username': user.username,
+        'name': ' '.join(part for part in (user.first_name, user.last_name) if part),
+        'payment_method': payment_method,
+    })
+
+
+# --- Callback Routing ---
+# Готовый к отправке экран: текст, разметка и режим форматирования
+Screen = namedtuple('Screen', 'text reply_markup parse_mode', defaults=(None, None))
+
+
+class Route:
+    """A single callback route: the screen to render and whether it replaces the old message."""
+    __slots__ = ('screen', 'name', 'answer', 'replace', 'blocking')
+
+    def __init__(self, screen, name=None, answer=True, replace=True, blocking=False):
+        self.screen = screen
+        # Label used in logs and metrics; routes sharing one generic screen pass their own.
+        self.name = name or screen.__name__
+        self.answer = answer
+        self.replace = replace
+        # The screen blocks: its own synchronous Bot API calls, workbook parsing, lead writes.
+        # The async app runs such screens in a worker thread instead of on the event loop.
+        self.blocking = blocking
+
+
+class CallbackRouter:
+    """Resolves call.data to a Route without walking an if/elif chain.
+
+    Exact keys live in a dict; parametrized keys (e.g. 'video_link_3') are matched
+    by the longest registered prefix in a character trie, and the remainder of the
+    string is passed to the screen as its argument.
+    """
+
+    _END = object()
+
+    def __init__(self):
+        self._exact = {}
+        self._trie = {}
+
+    def exact(self, key, **options):
+        def decorator(screen):
+            self._exact[key] = Route(screen, **options)
+            return screen
+        return decorator
+
+    def prefix(self, prefix, **options):
+        def decorator(screen):
+            node = self._trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[self._END] = (len(prefix), Route(screen, **options))
+            return screen
+        return decorator
+
+    def get(self, key):
+        return self._exact.get(key)
+
+    def remove(self, key):
+        self._exact.pop(key, None)
+
+    def resolve(self, data):
+        """Return (route, argument) for data, or (None, None) if nothing matches."""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, None
+        match = None
+        node = self._trie
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(self._END, match)
+        if match is None:
+            return None, None
+        length, route = match
+        return route, data[length:]
+
+
+callback_router = CallbackRouter()
+
+
+# Показывает экран на месте предыдущего сообщения одним вызовом edit_message_text.
+# Удаление + новая отправка нужны только если старое сообщение не текстовое (например, прайс-документ).
+async def navigate(client, message, screen):
+    # Сообщения старше 48 часов приходят как InaccessibleMessage без content_type
+    if getattr(message, 'content_type', None) == 'text':
+        try:
+            await client.call(
+                'edit_message_text',
+                screen.text,
+                message.chat.id,
+                message.message_id,
+                parse_mode=screen.parse_mode,
+                reply_markup=screen.reply_markup
             )
-        
-        # Отзывы
-        elif call.data == 'reviews_menu':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "reviews_menu")
-            time.sleep(0.1)
-            
-            bot.send_message(
-                call.message.chat.id,
-                "💬 Отзывы наших клиентов:",
-                reply_markup=reviews_menu()
+            return
+        except client.api_error as e:
+            if 'message is not modified' in e.description:
+                return
+            logger.warning("[Navigation] Failed to edit message %s in chat %s, resending: %s", message.message_id, message.chat.id, e)
+    await delete_previous_message(client, message.chat.id, message.message_id, "navigate")
+    await client.call('send_message', message.chat.id, screen.text, parse_mode=screen.parse_mode, reply_markup=screen.reply_markup)
+
+
+# --- Content Catalog ---
+class ContentCatalog:
+    """Menus, FAQ answers, contacts and payment texts loaded from a JSON file.
+
+    The file is validated and compiled once into immutable Screen objects with
+    pre-serialized keyboards, so rendering a screen is a dict lookup. Every key under
+    "screens" (and "aliases") becomes an exact callback route unless code already owns it;
+    "labels" holds button captions for keyboards that code builds itself (the price catalog).
+    On change the file is re-read and only the screens whose definition or keyboard
+    changed are recompiled; an invalid file is logged and the previous content kept.
+    """
+
+    SECTIONS = ('keyboards', 'screens', 'aliases', 'messages', 'labels')
+    SCREEN_KEYS = {'text', 'parse_mode', 'keyboard', 'replace'}
+    MESSAGE_KEYS = {'text', 'parse_mode', 'keyboard'}
+    PARSE_MODES = (None, 'Markdown', 'MarkdownV2', 'HTML')
+
+    def __init__(self, path, check_interval, router, required=(), required_labels=()):
+        self.path = path
+        self.check_interval = check_interval
+        self.router = router
+        # Screens, messages and labels referenced from code; a file without them is rejected.
+        self.required = tuple(required)
+        self.required_labels = tuple(required_labels)
+        self._lock = threading.Lock()
+        self._digest = None
+        self._checked_at = 0.0
+        self._source = {section: {} for section in self.SECTIONS}
+        self._screens = MappingProxyType({})
+        self._messages = MappingProxyType({})
+        # Replaced only when a label changes, so consumers can compare it by identity.
+        self.labels = MappingProxyType({})
+        # Callback keys currently routed to this catalog.
+        self._routed = frozenset()
+        self.reloads = 0
+        self.recompiled = 0
+
+    def screen(self, key):
+        return self._screens[key]
+
+    def message(self, key):
+        return self._messages[key]
+
+    def load(self):
+        """Initial load; raises ValueError so a broken catalog fails the deployment."""
+        with self._lock:
+            digest = file_digest(self.path)
+            self._apply(self._read())
+            self._digest = digest
+            self._checked_at = time.monotonic()
+
+    def due(self):
+        """Whether refresh() would look at the file, so callers can skip handing it to a thread."""
+        return time.monotonic() - self._checked_at >= self.check_interval
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            digest = file_digest(self.path)
+        except OSError as e:
+            logger.error("[Content] Cannot stat %s, keeping the loaded content: %s", self.path, e)
+            return
+        if digest == self._digest:
+            return
+        with self._lock:
+            if digest == self._digest:
+                return
+            # Remember the digest even on failure so a broken file is reported once, not on every check.
+            self._digest = digest
+            try:
+                self._apply(self._read())
+            except (OSError, ValueError) as e:
+                logger.error("[Content] Reload of %s failed, keeping the loaded content: %s", self.path, e)
+
+    def _read(self):
+        with open(self.path, encoding='utf-8') as f:
+            source = json.load(f)
+        errors = self.validate(source)
+        if errors:
+            raise ValueError("invalid content catalog:\n  " + "\n  ".join(errors))
+        return source
+
+    def validate(self, source):
+        """Return a list of problems with the catalog; an empty list means it is valid."""
+        if not isinstance(source, dict):
+            return ["top level must be an object"]
+        errors = ["unknown section '%s'" % key for key in source if key not in self.SECTIONS]
+        sections = {}
+        for section in self.SECTIONS:
+            sections[section] = source.get(section, {})
+            if not isinstance(sections[section], dict):
+                errors.append("'%s' must be an object" % section)
+                sections[section] = {}
+        keyboard_names = set(sections['keyboards'])
+        for name, rows in sections['keyboards'].items():
+            self._validate_rows('keyboards.%s' % name, rows, errors)
+        for section, allowed in (('screens', self.SCREEN_KEYS), ('messages', self.MESSAGE_KEYS)):
+            for key, definition in sections[section].items():
+                where = '%s.%s' % (section, key)
+                if not isinstance(definition, dict):
+                    errors.append("%s must be an object" % where)
+                    continue
+                errors.extend("%s: unknown field '%s'" % (where, field) for field in definition if field not in allowed)
+                text = definition.get('text')
+                if not isinstance(text, str) or not text.strip():
+                    errors.append("%s: text must be a non-empty string" % where)
+                elif len(text) > 4096:
+                    errors.append("%s: text is %s characters, Telegram allows 4096" % (where, len(text)))
+                if definition.get('parse_mode') not in self.PARSE_MODES:
+                    errors.append("%s: parse_mode must be one of Markdown, MarkdownV2, HTML" % where)
+                if 'replace' in definition and not isinstance(definition['replace'], bool):
+                    errors.append("%s: replace must be true or false" % where)
+                keyboard = definition.get('keyboard')
+                if isinstance(keyboard, str):
+                    if keyboard not in keyboard_names:
+                        errors.append("%s: unknown keyboard '%s'" % (where, keyboard))
+                elif keyboard is not None:
+                    self._validate_rows(where + '.keyboard', keyboard, errors)
+        for alias, target in sections['aliases'].items():
+            if target not in sections['screens']:
+                errors.append("aliases.%s: unknown screen '%s'" % (alias, target))
+            elif alias in sections['screens']:
+                errors.append("aliases.%s: also defined as a screen" % alias)
+        for key, label in sections['labels'].items():
+            if not isinstance(label, str) or not label.strip():
+                errors.append("labels.%s must be a non-empty string" % key)
+        defined = set(sections['screens']) | set(sections['messages'])
+        errors.extend("required screen or message '%s' is missing" % key for key in self.required if key not in defined)
+        errors.extend("required label '%s' is missing" % key for key in self.required_labels if key not in sections['labels'])
+        return errors
+
+    def _validate_rows(self, where, rows, errors):
+        if not isinstance(rows, list) or not all(isinstance(row, list) and row for row in rows):
+            errors.append("%s must be a list of non-empty button rows" % where)
+            return
+        for row in rows:
+            for button in row:
+                if not isinstance(button, dict) or not isinstance(button.get('text'), str) or not button['text']:
+                    errors.append("%s: every button needs a text" % where)
+                    continue
+                unknown = set(button) - {'text', 'callback_data', 'url'}
+                if unknown:
+                    errors.append("%s: button '%s' has unknown fields %s" % (where, button['text'], sorted(unknown)))
+                if ('callback_data' in button) == ('url' in button):
+                    errors.append("%s: button '%s' needs exactly one of callback_data or url" % (where, button['text']))
+                elif 'callback_data' in button and not 1 <= len(str(button['callback_data']).encode('utf-8')) <= 64:
+                    errors.append("%s: callback_data of '%s' must be 1-64 bytes" % (where, button['text']))
+
+    def _compile_one(self, definition):
+        keyboard = definition.get('keyboard')
+        if isinstance(keyboard, list):
+            keyboard = build_markup(keyboard).to_json()
+        elif keyboard is not None:
+            keyboard = keyboards[keyboard]
+        return Screen(definition['text'], keyboard, definition.get('parse_mode'))
+
+    def _compile_section(self, old_definitions, old_compiled, definitions, changed_keyboards):
+        compiled = {}
+        for key, definition in definitions.items():
+            keyboard = definition.get('keyboard')
+            unchanged = (
+                old_definitions.get(key) == definition
+                and not (isinstance(keyboard, str) and keyboard in changed_keyboards)
+                and key in old_compiled
             )
-        
-        # Частые вопросы
-        elif call.data == 'faq_menu':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "faq_menu")
-            time.sleep(0.1)
-            
-            bot.send_message(
+            if unchanged:
+                compiled[key] = old_compiled[key]
+            else:
+                compiled[key] = self._compile_one(definition)
+                self.recompiled += 1
+        return compiled
+
+    def _apply(self, source):
+        start_time = time.perf_counter()
+        recompiled_before = self.recompiled
+        old = self._source
+        source = {section: source.get(section, {}) for section in self.SECTIONS}
+        changed_keyboards = set()
+        for name, rows in source['keyboards'].items():
+            if old['keyboards'].get(name) != rows:
+                keyboards.register(partial(build_markup, rows), name)
+                changed_keyboards.add(name)
+        screens = self._compile_section(old['screens'], self._screens, source['screens'], changed_keyboards)
+        messages = self._compile_section(old['messages'], self._messages, source['messages'], changed_keyboards)
+        # An alias shares the compiled screen of its target.
+        for alias, target in source['aliases'].items():
+            screens[alias] = screens[target]
+        self._screens = MappingProxyType(screens)
+        self._messages = MappingProxyType(messages)
+        if source['labels'] != old['labels']:
+            self.labels = MappingProxyType(dict(source['labels']))
+        self._source = source
+        self._update_routes(source)
+        self.reloads += 1
+        logger.info(
+            "[Content] Loaded %s screens and %s messages from %s, recompiled %s in %.1f ms.",
+            len(screens), len(messages), self.path, self.recompiled - recompiled_before,
+            (time.perf_counter() - start_time) * 1000
+        )
+
+    def _owns(self, route):
+        return route is not None and route.screen == self.render
+
+    def _update_routes(self, source):
+        definitions = dict(source['screens'])
+        for alias, target in source['aliases'].items():
+            definitions[alias] = source['screens'][target]
+        for key, definition in definitions.items():
+            route = self.router.get(key)
+            replace = definition.get('replace', True)
+            if route is None or (self._owns(route) and route.replace != replace):
+                self.router.exact(key, name=key, replace=replace)(self.render)
+            elif not self._owns(route):
+                logger.debug("[Content] Route '%s' is handled in code, the catalog only provides its text.", key)
+        for key in self._routed - set(definitions):
+            if self._owns(self.router.get(key)):
+                self.router.remove(key)
+        self._routed = frozenset(definitions)
+
+    def render(self, call, arg):
+        return self._screens[call.data]
+
+
+# Ключи, на которые ссылается код бота: без них файл контента не будет принят
+content = ContentCatalog(
+    CONTENT_PATH, CONTENT_CHECK_INTERVAL, callback_router,
+    required=('payment_sbp', 'payment_card', 'start', 'price_document', 'price_error', 'price_not_found'),
+    required_labels=('price_previous', 'price_next', 'price_download', 'price_back', 'price_to_catalog', 'price_request'),
+)
+
+
+# Прайс
+@callback_router.exact('show_price', blocking=True)
+def show_price(call, arg):
+    logger.debug("Попытка отправить прайс-лист...")
+    # Проверяем существование файла
+    if os.path.exists(PRICE_FILE_PATH):
+        logger.debug("Файл price.xlsx найден")
+        # Документ нельзя показать через редактирование текста, поэтому меню удаляем
+        run_sync(delete_previous_message(sync_client, call.message.chat.id, call.message.message_id, "show_price"))
+        try:
+            caption = content.message('price_document')
+            document_cache.send(
                 call.message.chat.id,
-                "❓ Частые вопросы:",
-                reply_markup=faq_menu()
+                PRICE_FILE_PATH,
+                caption=caption.text,
+                parse_mode=caption.parse_mode,
+                reply_markup=caption.reply_markup  # Добавляем кнопку "назад"
             )
-        
-        # Прайс
-        elif call.data == 'show_price':
-            bot.answer_callback_query(call.id)
-            print("Попытка отправить прайс-лист...")
-
-            # Удаляем текущее сообщение с меню
-            delete_previous_message(call.message.chat.id, call.message.message_id, "show_price")
-
-            # Небольшая задержка для надежности
-            time.sleep(0.2)
-
-            # Проверяем существование файла
-            file_path = os.path.join(os.path.dirname(__file__), 'price.xlsx')
-            if os.path.exists(file_path):
-                print("Файл price.xlsx найден")
+            logger.info("Прайс-лист успешно отправлен")
+        except Superseded:
+            raise
+        except Exception as e:
+            logger.error("Ошибка при отправке файла: %s", e)
+            error = content.message('price_error')
+            bot.send_message(call.message.chat.id, error.text, parse_mode=error.parse_mode, reply_markup=error.reply_markup)
+    else:
+        logger.error("Файл price.xlsx НЕ найден!")
+        return content.message('price_not_found')
+
+# Прайс-лист прямо в чате, постранично из индекса price.xlsx
+@callback_router.exact('price_catalog', blocking=True)
+@callback_router.prefix('price_page_', blocking=True)
+def show_price_page(call, page):
+    if not os.path.exists(PRICE_FILE_PATH):
+        logger.error("Файл price.xlsx НЕ найден!")
+        return content.message('price_not_found')
+    price_catalog.refresh(content.labels)
+    return price_catalog.page(int(page) if page and page.isdigit() else 1)
+
+# Позиции прайса одной категории: 'price_cat_<категория>' или 'price_cat_<категория>_<страница>'
+@callback_router.prefix('price_cat_', blocking=True)
+def show_price_category(call, arg):
+    index, _, page = arg.partition('_')
+    if not index.isdigit():
+        return None
+    price_catalog.refresh(content.labels)
+    return price_catalog.category(int(index), int(page) if page.isdigit() else 1)
+
+# Отдельная позиция прайса
+@callback_router.prefix('price_item_', blocking=True)
+def show_price_item(call, index):
+    price_catalog.refresh(content.labels)
+    return price_catalog.item(int(index)) if index.isdigit() else None
+
+# Оплата СБП: текст экрана берётся из каталога, код только фиксирует лид
+@callback_router.exact('payment_sbp', blocking=True)
+def show_payment_sbp(call, arg):
+    record_lead(call, 'sbp')
+    return content.screen('payment_sbp')
+
+# Оплата картой
+@callback_router.exact('payment_card', blocking=True)
+def show_payment_card(call, arg):
+    record_lead(call, 'card')
+    return content.screen('payment_card')
+
+# Остальные экраны (меню, FAQ, контакты, ссылки) описаны в content.json и регистрируются
+# как маршруты при загрузке; маршруты, объявленные выше в коде, имеют приоритет.
+content.load()
+
+# Обработчик callback-кнопок
+async def handle_callback(client, call):
+    start_time = time.perf_counter()
+    route_name = 'unknown'
+    try:
+        await refresh_content(client)
+        route, arg = callback_router.resolve(call.data)
+        route_name = route.name if route else 'unknown'
+        set_log_context(route=route_name)
+        if route is None:
+            logger.warning("[Callback Router] No route for callback data: %s", call.data)
+            await client.call('answer_callback_query', call.id)
+            return
+        # Подтверждение нажатия не зависит от остальных вызовов, поэтому идёт параллельно
+        # с отрисовкой экрана; порядок удаления и отправки внутри экрана сохраняется.
+        ack = client.start('answer_callback_query', call.id) if route.answer else None
+        # Экран, заменяющий сообщение, не отправляется, если пользователь уже нажал другую кнопку
+        ticket = send_scheduler.begin(call.message.chat.id) if route.replace else None
+        try:
+            if route.blocking:
+                screen = await client.run_blocking(route.screen, call, arg)
+            else:
+                screen = route.screen(call, arg)
+            if screen is None:
+                # Экран сам отправил свой вывод (например, документ)
+                return
+            if route.replace:
+                await navigate(client, call.message, screen)
+            else:
+                await client.call('send_message', call.message.chat.id, screen.text, parse_mode=screen.parse_mode, reply_markup=screen.reply_markup)
+        finally:
+            if ticket is not None:
+                send_scheduler.end(ticket)
+            if ack is not None:
+                # Ошибка подтверждения только логируется, чтобы не прерывать обработку
                 try:
-                    with open(file_path, 'rb') as price_file:
-                        bot.send_document(
-                            call.message.chat.id,
-                            price_file,
-                            caption="💰 Актуальный прайс-лист на консультации",
-                            reply_markup=price_menu()  # Добавляем кнопку "назад"
-                        )
-                    print("Прайс-лист успешно отправлен")
+                    await client.wait(ack)
                 except Exception as e:
-                    print(f"Ошибка при отправке файла: {e}")
-                    bot.send_message(
-                        call.message.chat.id,
-                        "❌ Произошла ошибка при отправке прайс-листа. Пожалуйста, попробуйте позже.",
-                        reply_markup=main_menu()
-                    )
-            else:
-                print("Файл price.xlsx НЕ найден!")
-                bot.send_message(
-                    call.message.chat.id,
-                    "❌ Файл прайс-листа не найден. Пожалуйста, сообщите администратору.",
-                    reply_markup=main_menu()
-                )
-        
-        # Резерв
-        elif call.data == 'reserve':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "reserve")
-            time.sleep(0.1)
-            
-            bot.send_message(
-                call.message.chat.id,
-                "🔒 Функция резервирования временно недоступна. Мы работаем над её внедрением!",
-                reply_markup=main_menu()
-            )
-        
-        # Возврат в главное меню
-        elif call.data == 'back_to_contacts_menu':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "back_to_contacts_menu")
-            time.sleep(0.1)
-            bot.send_message(
-                call.message.chat.id,
-                "📞 Наши контакты:",
-                reply_markup=contacts_menu()
-            )
-        elif call.data == 'back_to_main':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "back_to_main")
-            time.sleep(0.1)
-            
-            bot.send_message(
-                call.message.chat.id,
-                "👋 Главное меню:",
-                reply_markup=main_menu()
-            )
-        
-        # Возврат из прайс-листа
-        elif call.data == 'back_to_main_from_price':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "back_to_main_from_price")
-            time.sleep(0.1)
-            
-            bot.send_message(
-                call.message.chat.id,
-                "👋 Главное меню:",
-                reply_markup=main_menu()
-            )
-        
-        # Ссылки на видео
-        elif call.data.startswith('video_link_'):
-            link_num = call.data.split('_')[-1]
-            bot.answer_callback_query(call.id)
-            bot.send_message(call.message.chat.id, f"📹 Вот ссылка {link_num}: [Перейти](https://example.com/video{link_num})", parse_mode='Markdown')
-        
-        # Ссылки на отзывы
-        elif call.data.startswith('review_link_'):
-            link_num = call.data.split('_')[-1]
-            bot.answer_callback_query(call.id)
-            bot.send_message(call.message.chat.id, f"💬 Вот отзыв {link_num}: [Читать](https://example.com/review{link_num})", parse_mode='Markdown')
-        
-        # Вопросы FAQ
-        elif call.data.startswith('faq_question_'):
-            q_num = call.data.split('_')[-1]
-            bot.answer_callback_query(call.id)
-            bot.send_message(call.message.chat.id, f"❓ Ответ на вопрос {q_num}: Ответ")
-        
-        # Контакты
-        elif call.data.startswith('contact_'):
-            contact_type = call.data.split('_')[-1]
-            contact_info = {
-                'address': '📍 Наш адрес: г. Москва, ул. Примерная, д. 1, офис 123',
-                'email': '📧 Email: info@yourcompany.com',
-                'phone': '📱 Телефон: +7 905 479-89-46',
-                'telegram': '💬 Telegram: @yourcompany',
-                'website': '🌐 Сайт: https://yourcompany.com'
-            }
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, f"contact_detail_{contact_type}")
-            time.sleep(0.1)
-            bot.send_message(call.message.chat.id, contact_info.get(contact_type, "Информация недоступна"), reply_markup=contact_detail_menu())
-        
-        # Оплата СБП
-        elif call.data == 'payment_sbp':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "payment_sbp")
-            time.sleep(0.1)
-            
-            bot.send_message(
-                call.message.chat.id,
-                "💳 *Оплата через Систему Быстрых Платежей (СБП)*\n\n"
-                "Для оплаты консультации:\n"
-                "1. Откройте приложение вашего банка\n"
-                "2. Перейдите в раздел «Платежи» → «СБП»\n"
-                "3. Введите номер телефона: `+7 905 479-89-46`\n"
-                "4. Укажите сумму согласно прайсу\n"
-                "5. В комментарии укажите: `Консультация Telegram`\n\n"
-                "После оплаты отправьте нам скриншот чека для подтверждения.",
-                parse_mode='Markdown',
-                reply_markup=main_menu()
-            )
-        
-        # Оплата картой
-        elif call.data == 'payment_card':
-            bot.answer_callback_query(call.id)
-            delete_previous_message(call.message.chat.id, call.message.message_id, "payment_card")
-            time.sleep(0.1)
-            
-            bot.send_message(
-                call.message.chat.id,
-                "💳 *Оплата банковской картой*\n\n"
-                "Для оплаты консультации:\n"
-                "1. Перейдите по ссылке для оплаты: [Оплатить картой](https://example.com/payment)\n"
-                "2. Укажите сумму согласно прайсу\n"
-                "3. В комментарии укажите: `Консультация Telegram`\n\n"
-                "После оплаты отправьте нам скриншот чека для подтверждения.",
-                parse_mode='Markdown',
-                reply_markup=main_menu()
-            )
-    
+                    logger.warning("[Outbound] answer_callback_query failed: %s", e)
+
+    except Superseded:
+        logger.debug("[Send Scheduler] Screen superseded by a newer click.")
     except Exception as e:
-        print(f"Ошибка в обработчике callback: {e}")
-        bot.answer_callback_query(call.id, text="Произошла ошибка. Пожалуйста, попробуйте позже.", show_alert=True)
+        logger.error("Ошибка в обработчике callback: %s", e)
+        await client.call('answer_callback_query', call.id, text="Произошла ошибка. Пожалуйста, попробуйте позже.", show_alert=True)
+    finally:
+        ROUTE_SECONDS.observe(time.perf_counter() - start_time, route_name)
 
 
-# --- Main Webhook Handler (from Template) ---
-@app.route('/', methods=['GET', 'POST'])
-def webhook_and_index():
-    print("--- Request received by webhook_and_index ---")
-    # --- Automatic Webhook Setup on Request (Attempt 4) ---
-    # This ensures the webhook is always set to the correct URL, even after cold starts.
-    try:
-        target_url = f"https://{PUBLIC_URL}/"
-        print(f"[Webhook Setup in Handler] Checking webhook status for: {target_url}")
+# Те же обработчики для апдейтов, которые идут через bot.process_new_updates()
+bot.register_message_handler(lambda message: run_sync(send_welcome(sync_client, message)), commands=['start'])
+bot.register_callback_query_handler(lambda call: run_sync(handle_callback(sync_client, call)), func=lambda call: True)
+
+
+# --- Webhook State ---
+class WebhookState:
+    """Caches the result of the webhook check so it stays off the per-update path.
+
+    The check runs once per process and is repeated only when the TTL expires or
+    when something signals drift via invalidate() (a failed update, /set_webhook).
+    Authenticated deliveries count as verification through confirm(), except while
+    drift is pending: that is only cleared by a real check with Telegram. Checks avoided
+    because the cached result was fresh are counted in skipped, checks a delivery stood in
+    for in confirmed.
+    """
+
+    def __init__(self, target_url, secret_token, ttl):
+        self.target_url = target_url
+        self.secret_token = secret_token
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._verified_at = None
+        self._invalidated = False
+        self.checks = 0
+        self.skipped = 0
+        self.confirmed = 0
+        self.resets = 0
+
+    def _is_fresh(self):
+        return self._verified_at is not None and time.monotonic() - self._verified_at < self.ttl
+
+    def _verified(self):
+        # Must be called with self._lock held.
+        self._verified_at = time.monotonic()
+        self._invalidated = False
+
+    def invalidate(self, reason=""):
+        with self._lock:
+            self._verified_at = None
+            self._invalidated = True
+        logger.info("[Webhook State] Marked for re-verification (%s).", reason)
+
+    def confirm(self):
+        """Record a verification observed from outside, e.g. an authenticated delivery.
+
+        Returns False while an invalidation is pending; the caller should then ensure().
+        """
+        if self._invalidated:
+            return False
+        if not self._is_fresh():
+            with self._lock:
+                if self._invalidated:
+                    return False
+                self._verified_at = time.monotonic()
+        self.confirmed += 1
+        return True
+
+    def ensure(self):
+        """Verify the webhook unless a fresh verification is cached."""
+        if self._is_fresh():
+            self.skipped += 1
+            return True
+        with self._lock:
+            # Another thread may have verified while we were waiting for the lock.
+            if self._is_fresh():
+                self.skipped += 1
+                return True
+            start_time = time.perf_counter()
+            try:
+                self.checks += 1
+                logger.info("[Webhook State] Checking webhook status for: %s", self.target_url)
+                current_webhook_info = bot.get_webhook_info()
+                if current_webhook_info and current_webhook_info.url == self.target_url:
+                    self._verified()
+                    return True
+                logger.warning("[Webhook State] Webhook not set or incorrect. Attempting to set...")
+                verified, _ = self._set()
+                return verified
+            except Exception as e:
+                logger.error("[Webhook State] Error during webhook check: %s", e)
+                return False
+            finally:
+                WEBHOOK_CHECK_SECONDS.observe(time.perf_counter() - start_time)
+
+    def reset(self):
+        """Unconditionally re-register the webhook. Returns (verified, current_url)."""
+        with self._lock:
+            return self._set()
+
+    def _set(self):
+        # Must be called with self._lock held.
+        self.resets += 1
+        self._verified_at = None
+        bot.remove_webhook()
+        time.sleep(0.5) # Give Telegram a moment to process
+        bot.set_webhook(url=self.target_url, secret_token=self.secret_token)
         current_webhook_info = bot.get_webhook_info()
+        current_url = current_webhook_info.url if current_webhook_info else 'None'
+        if current_url == self.target_url:
+            self._verified()
+            logger.info("[Webhook State] Webhook successfully verified to be set to %s", self.target_url)
+            return True, current_url
+        logger.error("[Webhook State] Webhook verification failed. Current URL: %s", current_url)
+        return False, current_url
 
-        if not current_webhook_info or current_webhook_info.url != target_url:
-            print("[Webhook Setup in Handler] Webhook not set or incorrect. Attempting to set...")
-            print("[Webhook Setup in Handler] Removing any existing webhook...")
-            bot.remove_webhook()
-            time.sleep(0.5) # Give Telegram a moment to process
+    def stats(self):
+        return {'checks': self.checks, 'skipped': self.skipped, 'confirmed': self.confirmed, 'resets': self.resets}
 
-            print(f"[Webhook Setup in Handler] Setting new webhook to {target_url} with secret token...")
-            bot.set_webhook(url=target_url, secret_token=WEBHOOK_SECRET)
-            print("[Webhook Setup in Handler] Webhook set command sent to Telegram.")
 
-            # Verify if the webhook was set correctly (optional, but good for debugging)
-            current_webhook_info_after_set = bot.get_webhook_info()
-            if current_webhook_info_after_set and current_webhook_info_after_set.url == target_url:
-                print(f"[Webhook Setup in Handler] Webhook successfully verified to be set to {target_url}")
-            else:
-                print(f"[Webhook Setup in Handler] Webhook verification failed. Current URL: {current_webhook_info_after_set.url if current_webhook_info_after_set else 'None'}")
-        else:
-            print(f"[Webhook Setup in Handler] Webhook already correctly set to: {current_webhook_info.url}")
-    except Exception as e:
-        print(f"[Webhook Setup in Handler] Error during automatic webhook setup: {e}")
-
-    # --- Automatic Handler Re-registration (Workaround for Vercel cold starts) ---
-    # This ensures handlers are always registered, even if global state is lost.
-    if not bot.message_handlers or not bot.callback_query_handlers:
-        print("[Handler Re-registration] Handlers not found or lost. Re-registering...")
-        # Explicitly call handler functions to re-register them with the bot object
-        send_welcome(None) # This will re-register the /start handler
-        handle_callback(None) # This will re-register the callback query handler
-        print(f"[Handler Re-registration] Message handlers after re-reg: {len(bot.message_handlers)}")
-        print(f"[Handler Re-registration] Callback handlers after re-reg: {len(bot.callback_query_handlers)}")
+webhook_state = WebhookState(
+    f"https://{PUBLIC_URL}/",
+    WEBHOOK_SECRET,
+    ttl=float(os.environ.get('WEBHOOK_CHECK_TTL', '600')),
+)
+
+
+# --- Update Dispatch ---
+def process_update(update):
+    return run_sync(handle_update(sync_client, update))
+
+
+async def handle_update(client, update):
+    """Dispatch one update through the given Bot API client, timing and logging it."""
+    start_time = time.perf_counter()
+    message = update.message or (update.callback_query.message if update.callback_query else None)
+    token = set_log_context(update_id=update.update_id, chat_id=message.chat.id if message else None)
+    try:
+        await dispatch_update(client, update)
+    finally:
+        # Without a background flusher, leads captured by this update are written before the
+        # response, since the instance may be frozen or recycled right after it. Updates that
+        # captured nothing skip the call (and, under ASGI, the thread hop).
+        if lead_sink is not None and not lead_sink.background and lead_sink.pending:
+            await client.run_blocking(lead_sink.flush)
+        duration = time.perf_counter() - start_time
+        UPDATE_SECONDS.observe(duration)
+        logger.info("Update processed.", extra={'duration_ms': round(duration * 1000, 2)})
+        _log_context.reset(token)
+
+
+async def dispatch_update(client, update):
+    logger.debug("[Webhook Handler] Received Update object: %s", update)
+    logger.debug("[Webhook Handler] Registered message handlers: %s", len(bot.message_handlers))
+    logger.debug("[Webhook Handler] Registered callback query handlers: %s", len(bot.callback_query_handlers))
+
+    logger.debug("Update received, passing to bot processor.")
+    # --- Manual Update Dispatch (Workaround for Vercel cold starts) ---
+    # This ensures updates are processed even if bot.process_new_updates fails to dispatch.
+    if update.message:
+        logger.debug("[Dispatch] Manual dispatching message: %s", update.message.text)
+        if update.message.text == '/start':
+            await send_welcome(client, update.message)
+        # Add other message handlers here if needed, or let bot.process_new_updates handle them
+    elif update.callback_query:
+        logger.debug("[Dispatch] Manual dispatching callback query: %s", update.callback_query.data)
+        await handle_callback(client, update.callback_query)
+    else:
+        logger.debug("[Dispatch] No manual dispatch for this update type. Falling back to bot.process_new_updates.")
+        # Let the bot's internal router handle all update types
+        start_time = time.time()
+        await client.process_other(update)
+        end_time = time.time()
+        logger.info("Bot processed update in %.4f seconds.", end_time - start_time)
+    # --- End Manual Update Dispatch ---
+
+
+# --- Update Queue (Fast-Ack Mode) ---
+class UpdateQueue:
+    """Bounded queue drained by a pool of worker threads.
+
+    Used when FAST_ACK is enabled: the webhook only parses and enqueues the update
+    and acknowledges Telegram at once. When the queue is full the update is either
+    rejected with 503 so Telegram redelivers it later ('reject'), or dropped ('drop').
+    Workers need a long-running process (e.g. gunicorn); on Vercel the function is
+    frozen after the response, so this mode is off by default.
+    """
+
+    def __init__(self, maxsize, workers, overflow='reject'):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.overflow = overflow
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._threads = []
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.max_depth = 0
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"update-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def put(self, update):
+        """Enqueue an update; returns False if it should be rejected for redelivery."""
+        if not self._threads:
+            self._start()
+        try:
+            self._queue.put_nowait(update)
+        except queue.Full:
+            with self._lock:
+                if self.overflow == 'drop':
+                    self.dropped += 1
+                    logger.warning("[Update Queue] Queue full, dropped update %s.", update.update_id)
+                    return True
+                self.rejected += 1
+            logger.warning("[Update Queue] Queue full, rejecting update %s for redelivery.", update.update_id)
+            return False
+        with self._lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def _work(self):
+        while True:
+            update = self._queue.get()
+            try:
+                process_update(update)
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                logger.error("[Update Queue] Error while processing update %s: %s", update.update_id, e)
+                with self._lock:
+                    self.failed += 1
+                webhook_state.invalidate("update worker error")
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'depth': self._queue.qsize(),
+                'max_depth': self.max_depth,
+                'capacity': self.maxsize,
+                'enqueued': self.enqueued,
+                'processed': self.processed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'rejected': self.rejected,
+            }
+
+
+FAST_ACK = os.environ.get('FAST_ACK', '').lower() in ('1', 'true', 'yes')
+update_queue = UpdateQueue(
+    maxsize=int(os.environ.get('FAST_ACK_QUEUE_SIZE', '256')),
+    workers=FAST_ACK_WORKERS,
+    overflow=os.environ.get('FAST_ACK_OVERFLOW', 'reject'),
+)
+
+
+# --- Update Deduplication ---
+class MemoryDedupStore:
+    """Remembers recently seen update_ids in process memory.
+
+    Entries expire after ttl seconds and the oldest ones are evicted beyond capacity.
+    A shared store for multi-instance deploys only needs the same add/discard methods
+    and a duplicates counter; see DEDUP_STORE below.
+    """
+
+    def __init__(self, capacity, ttl):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def add(self, key):
+        """Record key; returns False if it was already seen."""
+        now = time.monotonic()
+        with self._lock:
+            while self._seen:
+                oldest_key, seen_at = next(iter(self._seen.items()))
+                if now - seen_at < self.ttl:
+                    break
+                del self._seen[oldest_key]
+            if key in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen[key] = now
+            if len(self._seen) > self.capacity:
+                self._seen.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._seen.pop(key, None)
+
+
+class SqliteDedupStore:
+    """Same interface as MemoryDedupStore, kept in an SQLite database.
+
+    All worker processes on one host (or one mounted volume) see each other's updates.
+    Expired ids are pruned every prune_every additions, by wall-clock time since
+    processes don't share a monotonic clock.
+    """
+
+    def __init__(self, path, capacity, ttl, prune_every=100):
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._added = 0
+        self.duplicates = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=5)
+            # A lost dedup entry only risks handling one retry twice, so skip the per-commit fsync.
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def add(self, key):
+        """Record key; returns False if it was already seen by any process."""
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM seen_updates WHERE update_id = ? AND seen_at < ?', (key, now - self.ttl))
+            added = connection.execute('INSERT OR IGNORE INTO seen_updates (update_id, seen_at) VALUES (?, ?)', (key, now)).rowcount == 1
+        with self._lock:
+            if not added:
+                self.duplicates += 1
+                return False
+            self._added += 1
+            prune = self._added % self.prune_every == 0
+        if prune:
+            with connection:
+                connection.execute('DELETE FROM seen_updates WHERE seen_at < ?', (now - self.ttl,))
+                connection.execute(
+                    'DELETE FROM seen_updates WHERE update_id IN '
+                    '(SELECT update_id FROM seen_updates ORDER BY seen_at DESC LIMIT -1 OFFSET ?)', (self.capacity,)
+                )
+        return True
+
+    def discard(self, key):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM seen_updates WHERE update_id = ?', (key,))
+
+
+# update_id is the first field Telegram sends, so it can be read without parsing the whole update.
+_UPDATE_ID_RE = re.compile(rb'"update_id"\s*:\s*(\d+)')
+
+
+def extract_update_id(raw_data):
+    match = _UPDATE_ID_RE.search(raw_data, 0, 128)
+    return int(match.group(1)) if match else None
+
+
+# 'memory' (default, per process), 'sqlite' (shared by the processes that see DEDUP_STORE_PATH),
+# or 'package.module:factory' for a shared backend such as Redis; the factory is called with
+# capacity and ttl keywords.
+DEDUP_STORE = os.environ.get('DEDUP_STORE', 'memory')
+dedup_store = load_backend(DEDUP_STORE, {
+    'memory': MemoryDedupStore,
+    'sqlite': partial(SqliteDedupStore, os.environ.get('DEDUP_STORE_PATH', '/tmp/bot_dedup.sqlite3')),
+})(
+    capacity=int(os.environ.get('DEDUP_CAPACITY', '10000')),
+    ttl=float(os.environ.get('DEDUP_TTL', '3600')),
+)
+
+
+# --- Main Webhook Handler (from Template) ---
+@app.route('/', methods=['GET', 'POST'])
+def webhook_and_index():
+    logger.debug("--- Request received by webhook_and_index ---")
+    # Updates are dispatched manually below and the routing tables are built at import,
+    # so there is nothing to re-register per request.
 
     if request.method == 'GET':
+        # --- Automatic Webhook Setup on Request ---
+        # The check itself is cached by webhook_state, so only the first visit of a
+        # process (or the first one after the TTL expires / drift is signalled) talks to Telegram.
+        webhook_state.ensure()
         return "Bot is running!", 200
     if request.method == 'POST':
         secret_header = request.headers.get('X-Telegram-Bot-Api-Secret-Token')
         if secret_header != WEBHOOK_SECRET:
             return "Unauthorized", 401
+        # An authenticated delivery proves the webhook points here; no need to ask Telegram
+        # before serving the first update of a cold start. Drift signalled by a failed
+        # update is still checked with Telegram, on the next delivery.
+        if not webhook_state.confirm():
+            webhook_state.ensure()
         try:
-            raw_data = request.stream.read().decode('utf-8')
-            update = telebot.types.Update.de_json(raw_data)
-            print(f"[Webhook Handler] Received Update object: {update}")
-            print(f"[Webhook Handler] Registered message handlers: {len(bot.message_handlers)}")
-            print(f"[Webhook Handler] Registered callback query handlers: {len(bot.callback_query_handlers)}")
-
-            print("Update received, passing to bot processor.")
-            # --- Manual Update Dispatch (Workaround for Vercel cold starts) ---
-            # This ensures updates are processed even if bot.process_new_updates fails to dispatch.
-            if update.message:
-                print(f"[DEBUG] Manual dispatching message: {update.message.text}")
-                if update.message.text == '/start':
-                    send_welcome(update.message)
-                # Add other message handlers here if needed, or let bot.process_new_updates handle them
-            elif update.callback_query:
-                print(f"[DEBUG] Manual dispatching callback query: {update.callback_query.data}")
-                handle_callback(update.callback_query)
-            else:
-                print("[DEBUG] No manual dispatch for this update type. Falling back to bot.process_new_updates.")
-                # Let the bot's internal router handle all update types
-                start_time = time.time()
-                bot.process_new_updates([update])
-                end_time = time.time()
-                print(f"Bot processed update in {end_time - start_time:.4f} seconds.")
-            # --- End Manual Update Dispatch ---
-
+            raw_data = request.stream.read()
+            # Telegram retries deliveries it considers timed out; skip updates we already handled.
+            update_id = extract_update_id(raw_data)
+            if update_id is not None and not dedup_store.add(update_id):
+                logger.info("[Webhook Handler] Duplicate update %s skipped.", update_id)
+                return 'OK', 200
+            update = telebot.types.Update.de_json(raw_data.decode('utf-8'))
+            if FAST_ACK:
+                if not update_queue.put(update):
+                    # Let the redelivery through once there is room again.
+                    dedup_store.discard(update_id)
+                    return "Busy", 503
+                return 'OK', 200
+            process_update(update)
         except Exception as e:
-            print(f"An error occurred in webhook handler: {e}")
+            logger.error("An error occurred in webhook handler: %s", e)
+            webhook_state.invalidate("webhook handler error")
         return 'OK', 200
 
+# --- Stats Endpoint ---
+@app.route('/stats')
+def stats():
+    return {
+        'webhook': webhook_state.stats(),
+        'update_queue': update_queue.stats() if FAST_ACK else None,
+        'duplicate_updates': dedup_store.duplicates,
+    }, 200
+
+# --- Leads Endpoint ---
+# Disabled unless ADMIN_TOKEN is set; the token is expected in the X-Admin-Token header.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+
+@app.route('/leads')
+def leads():
+    if lead_sink is None or not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return "Not Found", 404
+    chat_id = request.args.get('chat_id', type=int)
+    if chat_id is not None:
+        return {'leads': lead_sink.for_chat(chat_id)}, 200
+    return {'leads': lead_sink.since(request.args.get('since', 0, type=float))}, 200
+
+# --- Metrics Endpoint ---
+@app.route('/metrics')
+def metrics():
+    lines = [
+        "# HELP bot_cold_starts_total Processes started (cold starts) for this instance.",
+        "# TYPE bot_cold_starts_total counter",
+        "bot_cold_starts_total 1",
+        "# HELP bot_init_seconds Time from module import to the app being ready.",
+        "# TYPE bot_init_seconds gauge",
+        f"bot_init_seconds {INIT_SECONDS}",
+        "# TYPE bot_webhook_checks_total counter",
+        f"bot_webhook_checks_total {webhook_state.checks}",
+        "# HELP bot_webhook_checks_skipped_total Webhook checks avoided: cached result fresh, or an authenticated delivery.",
+        "# TYPE bot_webhook_checks_skipped_total counter",
+        f'bot_webhook_checks_skipped_total{{source="cache"}} {webhook_state.skipped}',
+        f'bot_webhook_checks_skipped_total{{source="delivery"}} {webhook_state.confirmed}',
+        "# TYPE bot_duplicate_updates_total counter",
+        f"bot_duplicate_updates_total {dedup_store.duplicates}",
+    ]
+    for key, value in send_scheduler.stats().items():
+        lines.append(f"bot_send_scheduler_{key}_total {value}")
+    if FAST_ACK:
+        for key, value in update_queue.stats().items():
+            lines.append(f"bot_update_queue_{key} {value}")
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n", 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
 # --- Setup Endpoint (Safe Version) ---
 @app.route('/set_webhook')
 def set_webhook_manual():
     try:
-        target_url = f"https://{PUBLIC_URL}/"
-        print(f"Attempting to set webhook to: {target_url}")
-
-        # Always remove the webhook first to ensure a clean slate
-        print("Removing any existing webhook...")
-        bot.remove_webhook()
-        time.sleep(0.5) # Give Telegram a moment to process
-
-        print(f"Setting new webhook to {target_url} with secret token...")
-        bot.set_webhook(url=target_url, secret_token=WEBHOOK_SECRET)
-        print("Webhook set command sent to Telegram.")
-
-        # Verify if the webhook was set correctly (optional, but good for debugging)
-        current_webhook_info = bot.get_webhook_info()
-        if current_webhook_info and current_webhook_info.url == target_url:
-            print(f"Webhook successfully verified to be set to {target_url}")
-            return f"Webhook successfully set and verified to {target_url}", 200
+        logger.info("Attempting to set webhook to: %s", webhook_state.target_url)
+        verified, current_url = webhook_state.reset()
+        stats = webhook_state.stats()
+        if verified:
+            return (
+                f"Webhook successfully set and verified to {webhook_state.target_url} "
+                f"(checks skipped: {stats['skipped'] + stats['confirmed']}, {stats['confirmed']} of them by deliveries)"
+            ), 200
         else:
-            print(f"Webhook verification failed. Current URL: {current_webhook_info.url if current_webhook_info else 'None'}")
-            return f"Webhook set, but verification failed. Current URL: {current_webhook_info.url if current_webhook_info else 'None'}", 500
+            return f"Webhook set, but verification failed. Current URL: {current_url}", 500
 
     except Exception as e:
-        print(f"Error in set_webhook: {e}")
+        logger.error("Error in set_webhook: %s", e)
         return f"An error occurred: {e}", 500
 
 
+# Time spent importing dependencies and building the module state on this cold start.
+INIT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+logger.info("Cold start initialised in %.3f seconds.", INIT_SECONDS)
@@ -0,0 +1,63 @@
+"""Throughput benchmark for the update dedup check on the webhook path.
+
+Times extract_update_id() on a raw update body and dedup_store.add() for new ids,
+for repeated ids (the short-circuited retry) and for new ids at capacity, where every
+add also evicts, for the in-memory store and the SQLite store.
+
+    python bench/dedup.py
+    python bench/dedup.py --number 200000 --capacity 10000
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+from loadtest import load_app, make_update
+
+
+def rate(function, number):
+    start_time = time.perf_counter()
+    for _ in range(number):
+        function()
+    elapsed = time.perf_counter() - start_time
+    return number / elapsed, elapsed / number * 1e9
+
+
+def bench_store(name, store, capacity, number):
+    ids = itertools.count(1)
+    # Warm up to capacity so the "at capacity" case evicts on every add.
+    for _ in range(capacity):
+        store.add(next(ids))
+    per_second, ns = rate(lambda: store.add(next(ids)), number)
+    print(f"{name:<10}{'new id, at capacity':<24}{per_second:>14,.0f}{ns:>12.0f}")
+    retried = next(ids)
+    store.add(retried)
+    per_second, ns = rate(lambda: store.add(retried), number)
+    print(f"{name:<10}{'duplicate id':<24}{per_second:>14,.0f}{ns:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=100000, help="operations per in-memory case")
+    parser.add_argument('--sqlite-number', type=int, default=2000, help="operations per SQLite case")
+    parser.add_argument('--capacity', type=int, default=10000, help="store capacity")
+    parser.add_argument('--ttl', type=float, default=3600, help="store ttl in seconds")
+    args = parser.parse_args()
+
+    index, _ = load_app()
+    raw = json.dumps(make_update(123456789, 42, 'video_menu')).encode('utf-8')
+    print(f"{'store':<10}{'case':<24}{'ops/s':>14}{'ns/op':>12}")
+    per_second, ns = rate(lambda: index.extract_update_id(raw), args.number)
+    print(f"{'-':<10}{'extract_update_id':<24}{per_second:>14,.0f}{ns:>12.0f}")
+    bench_store('memory', index.MemoryDedupStore(args.capacity, args.ttl), args.capacity, args.number)
+    path = os.path.join(tempfile.mkdtemp(), 'dedup.sqlite3')
+    sqlite_capacity = min(args.capacity, args.sqlite_number)
+    bench_store('sqlite', index.SqliteDedupStore(path, sqlite_capacity, args.ttl), sqlite_capacity, args.sqlite_number)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""Offline load test for api/index.py against a local fake Telegram Bot API.
+
+Starts a stand-in for api.telegram.org on 127.0.0.1 with configurable latency and
+error rate, points the bot at it through TELEGRAM_API_URL, and replays synthetic
+/start and callback-query updates into the Flask app at a target rate. Reports
+p50/p95/p99 latency, throughput and outbound Bot API calls per update for each route.
+
+    python bench/loadtest.py --rate 50 --duration 10 --api-latency-ms 40
+    python bench/loadtest.py --mode both --rate 400 --duration 5   # sync vs async throughput
+
+Every run starts in a fresh process, so it also measures the cold start: module import,
+the first GET / and the first callback update. --duration 0 measures only that.
+
+    python bench/loadtest.py --duration 0 --max-import-ms 800 --max-first-update-ms 200
+
+Exits with status 1 when a --max-* budget is exceeded (cold-start steps or any route's
+p95), so the run gates regressions. The cold-start steps have default budgets, which
+tests/test_cold_start.py enforces; a budget of 0 disables that check. Nothing leaves
+the machine.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_ROUTES = (
+    '/start', 'video_menu', 'contacts_menu', 'make_request', 'reviews_menu', 'faq_menu',
+    'show_price', 'reserve', 'back_to_main', 'video_link_1', 'faq_question_2',
+    'contact_email', 'payment_sbp',
+)
+TOKEN = '123456:LOADTEST'
+SECRET = 'loadtest-secret'
+PUBLIC_URL = 'loadtest.local'
+HEADERS = {'X-Telegram-Bot-Api-Secret-Token': SECRET, 'Content-Type': 'application/json'}
+# The callback sent right after the first GET to time the cold path of an update.
+FIRST_CALLBACK = 'video_menu'
+
+
+# --- Fake Bot API ---
+class FakeBotApi:
+    """Answers Bot API methods with minimal valid payloads and records calls per chat."""
+
+    def __init__(self, latency, jitter, error_rate, error_code):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.calls = defaultdict(int)
+        self.calls_by_method = defaultdict(int)
+        # Size in bytes of every uploaded file, in arrival order.
+        self.uploads = []
+        self._forced_errors = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def fail_next(self, count, error_code=429, retry_after=1):
+        """Make the next count calls fail with error_code, regardless of error_rate."""
+        with self._lock:
+            self._forced_errors.extend([(error_code, retry_after)] * count)
+
+    def result_for(self, method, params):
+        chat_id = int(params.get('chat_id', 0) or 0)
+        message = {'message_id': 2, 'date': 1700000000, 'chat': {'id': chat_id, 'type': 'private'}, 'text': 'ok'}
+        if method == 'getWebhookInfo':
+            return {'url': f"https://{PUBLIC_URL}/", 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'loadtest_bot'}
+        if method == 'sendDocument':
+            # Sent by file_id: echo it back; uploaded: a fresh id per upload.
+            file_id = params.get('document') or f"FAKE_FILE_ID_{len(self.uploads)}"
+            message['document'] = {'file_id': file_id, 'file_unique_id': file_id}
+            return message
+        if method in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            return message
+        return True
+
+    def handle(self, handler):
+        parts = urlsplit(handler.path)
+        method = parts.path.rsplit('/', 1)[-1]
+        params = dict(parse_qsl(parts.query))
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else b''
+        content_type = handler.headers.get('Content-Type', '')
+        uploads = []
+        if body and content_type.startswith('application/x-www-form-urlencoded'):
+            params.update(parse_qsl(body.decode('utf-8')))
+        elif body and content_type.startswith('multipart/form-data'):
+            # The async client sends every parameter as a form field.
+            form = BytesParser(policy=HTTP).parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+            for part in form.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                if name and not part.get_filename():
+                    params[name] = part.get_content() if part.get_content_maintype() == 'text' else part.get_payload(decode=True).decode()
+                elif part.get_filename():
+                    uploads.append(len(part.get_payload(decode=True) or b''))
+        # Synthetic callback ids are the chat id, so every call can be attributed to its update.
+        owner = params.get('chat_id') or params.get('callback_query_id') or '0'
+        with self._lock:
+            self.calls[owner] += 1
+            self.calls_by_method[method] += 1
+            self.uploads.extend(uploads)
+            forced = self._forced_errors.pop(0) if self._forced_errors else None
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if forced is None and random.random() < self.error_rate:
+            forced = (self.error_code, 1)
+        if forced is not None:
+            status, retry_after = forced
+            payload = {'ok': False, 'error_code': status, 'description': 'Injected error'}
+            if status == 429:
+                payload['parameters'] = {'retry_after': retry_after}
+        else:
+            status = 200
+            payload = {'ok': True, 'result': self.result_for(method, params)}
+        data = json.dumps(payload).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out as separate writes; without this, Nagle plus delayed ACK
+            # adds ~40 ms to every call and swamps the latency being measured.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                api.handle(self)
+
+            def do_POST(self):
+                api.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}/bot{{0}}/{{1}}"
+
+    def stop(self):
+        self._server.shutdown()
+
+
+# --- Synthetic Updates ---
+def make_update(update_id, chat_id, route):
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Load'}
+    chat = {'id': chat_id, 'type': 'private'}
+    if route.startswith('/'):
+        return {
+            'update_id': update_id,
+            'message': {
+                'message_id': 1, 'date': 1700000000, 'chat': chat, 'from': user, 'text': route,
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(route)}],
+            },
+        }
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(chat_id), 'from': user, 'chat_instance': '1', 'data': route,
+            'message': {'message_id': 1, 'date': 1700000000, 'chat': chat, 'text': 'menu'},
+        },
+    }
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+# --- Load Generation ---
+def load_app(api_url=None):
+    """Import api/index.py with test credentials; api_url points it at a fake Bot API."""
+    os.environ.update({
+        'TELEGRAM_TOKEN': TOKEN,
+        'WEBHOOK_SECRET': SECRET,
+        'PUBLIC_URL': PUBLIC_URL,
+        'FILE_ID_STORE_PATH': os.path.join(tempfile.mkdtemp(), 'file_ids.json'),
+        # Synthetic payment clicks record leads; keep them out of any real LEADS_PATH.
+        'LEADS_PATH': os.path.join(tempfile.mkdtemp(), 'leads.jsonl'),
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'WARNING'),
+    })
+    if api_url:
+        os.environ['TELEGRAM_API_URL'] = api_url
+    sys.path.insert(0, os.path.join(ROOT, 'api'))
+    start_time = time.perf_counter()
+    import index
+    return index, time.perf_counter() - start_time
+
+
+def drive_sync(index, args, routes, first_id):
+    """Post updates through the Flask test client from a pool of client threads."""
+    total = int(args.rate * args.duration)
+    ids = itertools.count(first_id)
+    ids_lock = threading.Lock()
+    latencies = defaultdict(list)
+    chats_by_route = defaultdict(list)
+    results_lock = threading.Lock()
+    run_start = time.perf_counter()
+
+    def worker():
+        client = index.app.test_client()
+        while True:
+            with ids_lock:
+                n = next(ids)
+            if n >= first_id + total:
+                return
+            # Open-loop schedule: update n is due at n / rate regardless of how slow earlier ones were.
+            delay = run_start + (n - first_id) / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            route = routes[n % len(routes)]
+            chat_id = 1_000_000 + n
+            body = json.dumps(make_update(n, chat_id, route))
+            start_time = time.perf_counter()
+            client.post('/', data=body, headers=HEADERS)
+            elapsed = time.perf_counter() - start_time
+            with results_lock:
+                latencies[route].append(elapsed)
+                chats_by_route[route].append(str(chat_id))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, chats_by_route, time.perf_counter() - run_start
+
+
+def drive_async(args, routes, first_id):
+    """Call the ASGI app in-process from one event loop, one task per update."""
+    import asyncio
+    import asgi
+
+    total = int(args.rate * args.duration)
+    latencies = defaultdict(list)
+    chats_by_route = defaultdict(list)
+    headers = [(b'x-telegram-bot-api-secret-token', SECRET.encode()), (b'content-type', b'application/json')]
+
+    async def post(n, run_start):
+        delay = run_start + (n - first_id) / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        route = routes[n % len(routes)]
+        chat_id = 1_000_000 + n
+        body = json.dumps(make_update(n, chat_id, route)).encode()
+        scope = {'type': 'http', 'method': 'POST', 'path': '/', 'headers': headers}
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            pass
+
+        start_time = time.perf_counter()
+        await asgi.app(scope, receive, send)
+        latencies[route].append(time.perf_counter() - start_time)
+        chats_by_route[route].append(str(chat_id))
+
+    async def main():
+        run_start = time.perf_counter()
+        await asyncio.gather(*(post(n, run_start) for n in range(first_id, first_id + total)))
+        wall = time.perf_counter() - run_start
+        await asgi.abot.close_session()
+        return wall
+
+    wall = asyncio.run(main())
+    return latencies, chats_by_route, wall
+
+
+def report(mode, routes, fake_api, latencies, chats_by_route, wall_seconds, max_p95_ms):
+    total = sum(len(values) for values in latencies.values())
+    print(f"[{mode}] updates: {total}, wall: {wall_seconds:.2f} s, throughput: {total / wall_seconds:.1f} updates/s")
+    print(f"{'route':<20}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'calls/upd':>11}")
+    failed = False
+    for route in routes:
+        values = latencies.get(route)
+        if not values:
+            continue
+        calls = statistics.mean(fake_api.calls.get(chat, 0) for chat in chats_by_route[route])
+        p95 = percentile(values, 0.95) * 1000
+        print(f"{route:<20}{len(values):>6}{percentile(values, 0.5) * 1000:>10.1f}{p95:>10.1f}"
+              f"{percentile(values, 0.99) * 1000:>10.1f}{calls:>11.2f}")
+        if max_p95_ms and p95 > max_p95_ms:
+            failed = True
+    if failed:
+        print(f"FAIL: [{mode}] p95 latency above budget of {max_p95_ms} ms")
+    return failed
+
+
+def cold_start(index, import_seconds, args):
+    """Time the first GET / and the first callback after import; returns True if over budget."""
+    client = index.app.test_client()
+    start_time = time.perf_counter()
+    client.get('/')
+    first_get_seconds = time.perf_counter() - start_time
+    body = json.dumps(make_update(0, 999_999, FIRST_CALLBACK))
+    start_time = time.perf_counter()
+    client.post('/', data=body, headers=HEADERS)
+    first_update_seconds = time.perf_counter() - start_time
+
+    steps = (
+        ('import', import_seconds, args.max_import_ms),
+        ('first GET /', first_get_seconds, args.max_first_get_ms),
+        ('first callback', first_update_seconds, args.max_first_update_ms),
+    )
+    print("cold start: " + ", ".join(f"{name}: {seconds * 1000:.1f} ms" for name, seconds, _ in steps)
+          + f", total: {sum(seconds for _, seconds, _ in steps) * 1000:.1f} ms")
+    failed = False
+    for name, seconds, budget in steps:
+        if budget and seconds * 1000 > budget:
+            print(f"FAIL: {name} took {seconds * 1000:.1f} ms, budget {budget} ms")
+            failed = True
+    return failed
+
+
+def run(args):
+    fake_api = FakeBotApi(args.api_latency_ms / 1000, args.api_jitter_ms / 1000, args.error_rate, args.error_code)
+    api_url = fake_api.start()
+    index, import_seconds = load_app(api_url)
+    routes = args.routes.split(',') if args.routes else list(DEFAULT_ROUTES)
+
+    failed = cold_start(index, import_seconds, args)
+    modes = ('sync', 'async') if args.mode == 'both' else (args.mode,)
+    if int(args.rate * args.duration) == 0:
+        modes = ()
+    for number, mode in enumerate(modes):
+        # Each mode gets its own update ids and chats so dedup and per-chat limits don't interact.
+        first_id = 1 + number * 10_000_000
+        if mode == 'sync':
+            results = drive_sync(index, args, routes, first_id)
+        else:
+            results = drive_async(args, routes, first_id)
+        failed = report(mode, routes, fake_api, *results, args.max_p95_ms) or failed
+    fake_api.stop()
+
+    print("calls by method: " + ", ".join(f"{m}={c}" for m, c in sorted(fake_api.calls_by_method.items())))
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rate', type=float, default=50, help="target updates per second")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of traffic to generate")
+    parser.add_argument('--mode', choices=('sync', 'async', 'both'), default='sync',
+                        help="drive the Flask app, the ASGI app (api/asgi.py), or both in turn")
+    parser.add_argument('--concurrency', type=int, default=16, help="client threads posting updates in sync mode")
+    parser.add_argument('--routes', default='', help="comma-separated routes (default: a mix of all screens)")
+    parser.add_argument('--api-latency-ms', type=float, default=40, help="base latency of every fake Bot API call")
+    parser.add_argument('--api-jitter-ms', type=float, default=10, help="uniform extra latency per call")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of Bot API calls that fail")
+    parser.add_argument('--error-code', type=int, default=500, help="HTTP status of injected failures (e.g. 429)")
+    # p95 depends on the chosen rate and API latency, so it has no default budget. The
+    # cold-start defaults are a few times the measured cold start (about 270 ms import, 50 ms
+    # first GET and 55 ms first callback at the default 40 ms API latency).
+    parser.add_argument('--max-p95-ms', type=float, default=0, help="fail if any route's p95 exceeds this (0: off)")
+    parser.add_argument('--max-import-ms', type=float, default=1000, help="fail if importing the app exceeds this (0: off)")
+    parser.add_argument('--max-first-get-ms', type=float, default=300, help="fail if the first GET / exceeds this (0: off)")
+    parser.add_argument('--max-first-update-ms', type=float, default=300,
+                        help="fail if the first callback update after import exceeds this (0: off)")
+    return run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
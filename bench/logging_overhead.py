@@ -0,0 +1,115 @@
+"""CPU cost of per-request logging: structured logging at INFO vs. the old print calls.
+
+Runs process_update() for callback updates with the Bot API answered in-process (no
+sockets, so the numbers are CPU, not network), once with logging disabled and once per
+log level, and attributes the difference to logging. The old behaviour is the sequence
+of print calls the webhook used to make for the same update, including the full
+f"{update}" repr. Output is discarded but counted, since log volume is what a
+hosted log collector bills and ingests.
+
+    python bench/logging_overhead.py
+    python bench/logging_overhead.py --number 5000 --route video_menu
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+from loadtest import FakeBotApi, load_app, make_update
+
+
+def old_prints(update, out):
+    """The print calls the webhook made for one callback update before structured logging."""
+    call = update.callback_query
+    print("--- Request received by webhook_and_index ---", file=out)
+    print("[Webhook Setup in Handler] Checking webhook status for: https://example.com/", file=out)
+    print("[Webhook Setup in Handler] Webhook already correctly set to: https://example.com/", file=out)
+    print(f"[Webhook Handler] Received Update object: {update}", file=out)
+    print(f"[Webhook Handler] Registered message handlers: {1}", file=out)
+    print(f"[Webhook Handler] Registered callback query handlers: {1}", file=out)
+    print("Update received, passing to bot processor.", file=out)
+    print(f"[DEBUG] Manual dispatching callback query: {call.data}", file=out)
+    print(f"[Message Deletion] Successfully deleted message {call.message.message_id} "
+          f"in chat {call.message.chat.id} ({call.data}).", file=out)
+
+
+class CountingSink:
+    """Write-only stream that discards output and counts the characters written."""
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, text):
+        self.written += len(text)
+
+    def flush(self):
+        pass
+
+
+def cpu_per_call(function, make_updates, repeat):
+    """Best-of-repeat CPU microseconds per update; each run gets fresh updates."""
+    best = None
+    for _ in range(repeat):
+        updates = make_updates()
+        start_time = time.process_time()
+        for update in updates:
+            function(update)
+        elapsed = (time.process_time() - start_time) / len(updates) * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=2000, help="updates per measurement")
+    parser.add_argument('--route', default='video_menu', help="callback data of the synthetic updates")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per configuration; the fastest is reported")
+    args = parser.parse_args()
+
+    for name in ('RATE_LIMIT_GLOBAL', 'RATE_LIMIT_CHAT', 'RATE_LIMIT_CHAT_BURST'):
+        os.environ.setdefault(name, '1000000000')
+    index, _ = load_app()
+    # Answer Bot API calls in-process so only CPU is measured.
+    fake_api = FakeBotApi(0, 0, 0, 500)
+    index._make_request = lambda token, method_name, method='get', params=None, files=None: fake_api.result_for(method_name, params or {})
+    sink = CountingSink()
+    index._log_handler.setStream(sink)
+
+    ids = itertools.count(1)
+
+    def updates():
+        # Fresh update and chat ids per run, so per-chat state never carries over between runs.
+        return [
+            index.telebot.types.Update.de_json(json.dumps(make_update(n, 1_000_000 + n, args.route)))
+            for n in itertools.islice(ids, args.number)
+        ]
+
+    # Warm up thread pools, caches and the route before measuring.
+    for update in updates()[:50]:
+        index.process_update(update)
+
+    def measure(function):
+        sink.written = 0
+        cpu = cpu_per_call(function, updates, args.repeat)
+        return cpu, sink.written / (args.number * args.repeat)
+
+    print(f"{'configuration':<36}{'us/update':>12}{'logging us':>12}{'log B/update':>14}")
+    index.logger.disabled = True
+    bare, _ = measure(index.process_update)
+    index.logger.disabled = False
+    print(f"{'process_update, logging off':<36}{bare:>12.1f}{0:>12.1f}{0:>14.0f}")
+    for level in ('INFO', 'DEBUG'):
+        index.logger.setLevel(level)
+        total, written = measure(index.process_update)
+        print(f"{'process_update, ' + level:<36}{total:>12.1f}{total - bare:>12.1f}{written:>14.0f}")
+    index.logger.setLevel(logging.INFO)
+    old, written = measure(lambda update: old_prints(update, sink))
+    print(f"{'old print calls (logging only)':<36}{'':>12}{old:>12.1f}{written:>14.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
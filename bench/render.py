@@ -0,0 +1,66 @@
+"""Allocation and latency benchmark for rendering each screen's keyboard.
+
+Compares building the markup per click (build_markup(rows).to_json(), what the menu
+factories used to do) with the pre-serialized payload from the keyboard cache, and
+reports time and bytes allocated per render for every keyboard in content.json.
+
+    python bench/render.py
+    python bench/render.py --number 20000
+"""
+import argparse
+import json
+import sys
+import timeit
+import tracemalloc
+
+from loadtest import load_app
+
+
+def allocated_per_call(function, number):
+    """Bytes allocated per call, counting memory that is freed again before the call ends."""
+    function()
+    tracemalloc.start()
+    total = 0
+    for _ in range(number):
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        total += peak - start
+    tracemalloc.stop()
+    return total / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=5000, help="renders per timing run")
+    parser.add_argument('--repeat', type=int, default=5, help="timing runs; the fastest is reported")
+    parser.add_argument('--alloc-number', type=int, default=200, help="renders traced for allocations")
+    args = parser.parse_args()
+
+    index, _ = load_app()
+    with open(index.CONTENT_PATH, encoding='utf-8') as f:
+        definitions = json.load(f)['keyboards']
+
+    print(f"{'keyboard':<22}{'build us':>10}{'cached us':>11}{'build B':>10}{'cached B':>10}")
+    totals = [0.0, 0.0]
+    for name, rows in definitions.items():
+        def build():
+            return index.build_markup(rows).to_json()
+
+        def cached():
+            return index.keyboards[name]
+
+        assert build() == cached(), name
+        build_us = min(timeit.repeat(build, number=args.number, repeat=args.repeat)) / args.number * 1e6
+        cached_us = min(timeit.repeat(cached, number=args.number, repeat=args.repeat)) / args.number * 1e6
+        totals[0] += build_us
+        totals[1] += cached_us
+        print(f"{name:<22}{build_us:>10.2f}{cached_us:>11.3f}"
+              f"{allocated_per_call(build, args.alloc_number):>10.0f}{allocated_per_call(cached, args.alloc_number):>10.0f}")
+    print(f"{'all keyboards':<22}{totals[0]:>10.2f}{totals[1]:>11.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
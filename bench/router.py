@@ -0,0 +1,94 @@
+"""Micro-benchmark: CallbackRouter dispatch vs. the old handle_callback if/elif chain.
+
+For each route count, builds a router and an equivalent generated if/elif function
+(exact keys compared with ==, parametrized keys matched with startswith and split('_'),
+as the original handler did) and times resolving a uniform mix of callback data.
+
+    python bench/router.py
+    python bench/router.py --sizes 20,200,2000 --lookups 20000
+"""
+import argparse
+import random
+import sys
+import timeit
+
+from loadtest import load_app
+
+# Share of routes that take a parameter, like video_link_<n> or contact_<type> in the bot.
+PREFIX_SHARE = 0.2
+
+
+def make_routes(count):
+    prefixes = max(1, int(count * PREFIX_SHARE))
+    exact = [f'screen_{i}' for i in range(count - prefixes)]
+    parametrized = [f'param{i}_' for i in range(prefixes)]
+    return exact, parametrized
+
+
+def build_chain(exact, parametrized):
+    """Generate the if/elif dispatcher the way handle_callback used to be written."""
+    lines = ['def dispatch(data):']
+    keyword = 'if'
+    for key in exact:
+        lines.append(f'    {keyword} data == {key!r}:')
+        lines.append(f'        return {key!r}, None')
+        keyword = 'elif'
+    for prefix in parametrized:
+        lines.append(f'    {keyword} data.startswith({prefix!r}):')
+        lines.append(f"        return {prefix!r}, data.split('_')[-1]")
+        keyword = 'elif'
+    lines.append('    return None, None')
+    namespace = {}
+    exec('\n'.join(lines), namespace)
+    return namespace['dispatch']
+
+
+def build_router(router_class, exact, parametrized):
+    def screen(call, arg):
+        return None
+
+    router = router_class()
+    for key in exact:
+        router.exact(key)(screen)
+    for prefix in parametrized:
+        router.prefix(prefix)(screen)
+    return router
+
+
+def measure(function, data, repeat):
+    """Best-of-repeat nanoseconds per call over the whole data set."""
+    def run():
+        for item in data:
+            function(item)
+    return min(timeit.repeat(run, number=1, repeat=repeat)) / len(data) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='20,200,2000', help="comma-separated route counts")
+    parser.add_argument('--lookups', type=int, default=20000, help="callback data values resolved per run")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per measurement; the fastest is reported")
+    args = parser.parse_args()
+
+    index, _ = load_app()
+    rng = random.Random(1)
+    print(f"{'routes':>8}{'if/elif ns':>14}{'router ns':>12}{'speedup':>10}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        exact, parametrized = make_routes(size)
+        chain = build_chain(exact, parametrized)
+        router = build_router(index.CallbackRouter, exact, parametrized)
+        keys = exact + [f'{prefix}{rng.randint(1, 9)}' for prefix in parametrized]
+        data = [rng.choice(keys) for _ in range(args.lookups)]
+        # Both dispatchers must agree before their speed is compared.
+        for item in keys:
+            route, arg = router.resolve(item)
+            _, expected_arg = chain(item)
+            assert route is not None and (arg or None) == expected_arg, item
+        chain_ns = measure(chain, data, args.repeat)
+        router_ns = measure(router.resolve, data, args.repeat)
+        print(f"{size:>8}{chain_ns:>14.0f}{router_ns:>12.0f}{chain_ns / router_ns:>9.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
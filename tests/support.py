@@ -0,0 +1,40 @@
+"""Shared test setup: one fake Bot API and one import of api/index.py per test process.
+
+index.py reads its configuration at import time, so every test module goes through
+this one and gets the same app, pointed at a local FakeBotApi with rate limits high
+enough that tests never wait for a token.
+"""
+import itertools
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+from loadtest import SECRET, FakeBotApi, load_app, make_update  # noqa: E402
+
+os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+os.environ.setdefault('RATE_LIMIT_GLOBAL', '100000')
+os.environ.setdefault('RATE_LIMIT_CHAT', '100000')
+os.environ.setdefault('RATE_LIMIT_CHAT_BURST', '100000')
+os.environ.setdefault('RATE_LIMIT_MAX_RETRY_AFTER', '0.05')
+
+fake_api = FakeBotApi(latency=0, jitter=0, error_rate=0, error_code=500)
+index, _ = load_app(fake_api.start())
+
+HEADERS = {'X-Telegram-Bot-Api-Secret-Token': SECRET, 'Content-Type': 'application/json'}
+_ids = itertools.count(1)
+
+
+def next_id():
+    """A fresh update id (also used as a chat id), so tests never see each other's calls."""
+    return next(_ids)
+
+
+def update_body(update_id, chat_id, route):
+    return json.dumps(make_update(update_id, chat_id, route))
+
+
+def calls_for(chat_id):
+    return fake_api.calls.get(str(chat_id), 0)
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import threading
+import unittest
+from unittest import mock
+
+from support import HEADERS, calls_for, fake_api, index, next_id, update_body
+
+import asgi
+
+ASGI_HEADERS = [(name.lower().encode(), value.encode()) for name, value in HEADERS.items()]
+
+
+def post(body):
+    """POST one update to the ASGI app and return the response status."""
+    responses = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body.encode(), 'more_body': False}
+
+    async def send(message):
+        responses.append(message)
+
+    async def main():
+        try:
+            await asgi.app({'type': 'http', 'method': 'POST', 'path': '/', 'headers': ASGI_HEADERS}, receive, send)
+        finally:
+            await asgi.abot.close_session()
+
+    asyncio.run(main())
+    return responses[0]['status']
+
+
+class AsgiAppTest(unittest.TestCase):
+    def test_start_and_callbacks_use_the_shared_handlers(self):
+        chat_id = next_id()
+        sent = fake_api.calls_by_method['sendMessage']
+
+        self.assertEqual(post(update_body(next_id(), chat_id, '/start')), 200)
+        self.assertEqual(post(update_body(next_id(), chat_id, 'video_menu')), 200)
+
+        self.assertEqual(fake_api.calls_by_method['sendMessage'], sent + 1)
+        self.assertEqual(calls_for(chat_id), 3)
+
+    def test_blocking_screens_run_off_the_event_loop(self):
+        threads = []
+        record_lead = index.record_lead
+
+        def spy(call, method):
+            threads.append(threading.current_thread())
+            record_lead(call, method)
+
+        with mock.patch.object(index, 'record_lead', spy):
+            self.assertEqual(post(update_body(next_id(), next_id(), 'payment_card')), 200)
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    def test_other_update_types_fall_back_to_the_bot(self):
+        body = json.dumps({'update_id': next_id(), 'edited_message': json.loads(update_body(0, next_id(), '/start'))['message']})
+        with mock.patch.object(asgi.abot, 'process_new_updates') as fallback:
+            self.assertEqual(post(body), 200)
+        fallback.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
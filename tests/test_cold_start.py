@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from support import ROOT
+
+LOADTEST = os.path.join(ROOT, 'bench', 'loadtest.py')
+# Set by support.py for the in-process app; the load test configures its own.
+INHERITED = ('TELEGRAM_API_URL', 'LOG_LEVEL', 'LEADS_PATH', 'FILE_ID_STORE_PATH')
+
+
+def run_loadtest(*args):
+    env = {key: value for key, value in os.environ.items() if key not in INHERITED and not key.startswith('RATE_LIMIT_')}
+    return subprocess.run(
+        [sys.executable, LOADTEST, '--duration', '0', *args],
+        env=env, capture_output=True, text=True, timeout=120,
+    )
+
+
+class ColdStartBudgetTest(unittest.TestCase):
+    """Runs the cold-start measurement in a fresh interpreter, as a deploy would start."""
+
+    def test_cold_start_is_within_the_default_budgets(self):
+        result = run_loadtest()
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn('cold start:', result.stdout)
+
+    def test_exceeded_budget_fails_the_run(self):
+        result = run_loadtest('--max-first-update-ms', '0.001')
+        self.assertEqual(result.returncode, 1, result.stdout + result.stderr)
+        self.assertIn('FAIL: first callback', result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
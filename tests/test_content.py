@@ -0,0 +1,146 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import telebot
+
+from support import index
+
+CONTACT_SCREENS = ('contact_address', 'contact_email', 'contact_phone', 'contact_telegram', 'contact_website')
+
+
+def source_of(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def call(data):
+    return telebot.types.CallbackQuery.de_json({
+        'id': '1', 'from': {'id': 1, 'is_bot': False, 'first_name': 'Test'},
+        'chat_instance': '1', 'data': data,
+    })
+
+
+class ContentCatalogTest(unittest.TestCase):
+    """Each test works on its own copy of content.json, with its own router."""
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'content.json')
+        shutil.copy(index.CONTENT_PATH, self.path)
+        # The contact screens get a keyboard of their own, so editing it cannot change the
+        # shared keyboards the rest of the suite renders.
+        source = source_of(self.path)
+        source['keyboards']['content_test_menu'] = copy.deepcopy(source['keyboards']['contact_detail_menu'])
+        for key in CONTACT_SCREENS:
+            source['screens'][key]['keyboard'] = 'content_test_menu'
+        self.write(source)
+
+        self.router = index.CallbackRouter()
+        self.code_route = self.router.exact('show_price')(lambda call, arg: None)
+        self.catalog = index.ContentCatalog(self.path, 0, self.router, required=('start',), required_labels=('price_next',))
+        self.catalog.load()
+
+    def write(self, source):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(source, f, ensure_ascii=False)
+
+    def edit(self, change):
+        """Apply change to the file's source, reload, and return how many screens were recompiled."""
+        source = source_of(self.path)
+        change(source)
+        self.write(source)
+        recompiled = self.catalog.recompiled
+        self.catalog.refresh()
+        return self.catalog.recompiled - recompiled
+
+    def render(self, data):
+        route, arg = self.router.resolve(data)
+        return route.screen(call(data), arg) if route else None
+
+    def test_invalid_catalog_is_reported_in_full(self):
+        source = source_of(self.path)
+        source['screens']['faq_menu']['keyboard'] = 'no_such_keyboard'
+        source['screens']['reserve']['parse_mode'] = 'RTF'
+        source['keyboards']['main_menu'][0][0]['callback_data'] = 'x' * 65
+        del source['messages']['start']
+        source['labels']['price_next'] = ''
+
+        errors = self.catalog.validate(source)
+
+        self.assertEqual(len(errors), 5, errors)
+        self.assertIn("screens.faq_menu: unknown keyboard 'no_such_keyboard'", errors)
+        self.assertIn("required screen or message 'start' is missing", errors)
+
+    def test_broken_file_fails_the_initial_load(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{"screens": {"main_menu": {}}}')
+        with self.assertRaises(ValueError):
+            index.ContentCatalog(self.path, 0, index.CallbackRouter(), required=('start',)).load()
+
+    def test_edited_screen_is_the_only_one_recompiled(self):
+        faq = self.render('faq_menu')
+
+        def change(source):
+            source['screens']['main_menu']['text'] = 'Новое главное меню'
+
+        self.assertEqual(self.edit(change), 1)
+        self.assertEqual(self.render('main_menu').text, 'Новое главное меню')
+        self.assertIs(self.render('faq_menu'), faq)
+        # An alias follows its target.
+        self.assertEqual(self.render('back_to_main').text, 'Новое главное меню')
+
+    def test_edited_keyboard_recompiles_the_screens_that_use_it(self):
+        def change(source):
+            source['keyboards']['content_test_menu'][0][0]['text'] = 'Назад к контактам'
+
+        self.assertEqual(self.edit(change), len(CONTACT_SCREENS))
+        self.assertIn('Назад к контактам', json.loads(self.render('contact_email').reply_markup)['inline_keyboard'][0][0]['text'])
+
+    def test_invalid_edit_keeps_the_loaded_content(self):
+        menu = self.render('main_menu')
+
+        def change(source):
+            source['screens']['main_menu']['keyboard'] = 'no_such_keyboard'
+
+        self.assertEqual(self.edit(change), 0)
+        self.assertIs(self.render('main_menu'), menu)
+
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{not json')
+        self.catalog.refresh()
+        self.assertIs(self.render('main_menu'), menu)
+
+    def test_added_and_deleted_screens_gain_and_lose_routes(self):
+        def change(source):
+            source['screens']['promo'] = {'text': 'Акция', 'replace': False}
+            del source['screens']['reserve']
+            # Code owns show_price; the catalog must never take its route over or remove it.
+            source['screens']['show_price'] = {'text': 'Прайс'}
+
+        self.edit(change)
+
+        self.assertEqual(self.render('promo').text, 'Акция')
+        self.assertFalse(self.router.resolve('promo')[0].replace)
+        self.assertIsNone(self.render('reserve'))
+        self.assertIsNone(self.router.resolve('reserve')[0])
+
+        self.assertIs(self.router.get('show_price').screen, self.code_route)
+        self.edit(lambda source: source['screens'].pop('show_price'))
+        self.assertIs(self.router.get('show_price').screen, self.code_route)
+
+    def test_labels_keep_their_identity_until_one_changes(self):
+        labels = self.catalog.labels
+
+        self.edit(lambda source: source['screens']['main_menu'].update(text='Меню'))
+        self.assertIs(self.catalog.labels, labels)
+
+        self.edit(lambda source: source['labels'].update(price_next='Дальше'))
+        self.assertIsNot(self.catalog.labels, labels)
+        self.assertEqual(self.catalog.labels['price_next'], 'Дальше')
+
+
+if __name__ == '__main__':
+    unittest.main()
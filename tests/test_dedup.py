@@ -0,0 +1,124 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from support import HEADERS, calls_for, index, next_id, update_body
+
+
+class WebhookReplayTest(unittest.TestCase):
+    """Telegram redelivers updates it considers timed out; each must be handled once."""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+
+    def test_retried_update_is_dispatched_once(self):
+        update_id = chat_id = next_id()
+        body = update_body(update_id, chat_id, '/start')
+        duplicates = index.dedup_store.duplicates
+
+        first = self.client.post('/', data=body, headers=HEADERS)
+        retry = self.client.post('/', data=body, headers=HEADERS)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(calls_for(chat_id), 1)
+        self.assertEqual(index.dedup_store.duplicates, duplicates + 1)
+
+    def test_update_rejected_with_503_is_processed_when_redelivered(self):
+        update_id = chat_id = next_id()
+        body = update_body(update_id, chat_id, '/start')
+
+        with mock.patch.object(index, 'FAST_ACK', True), mock.patch.object(index.update_queue, 'put', return_value=False):
+            rejected = self.client.post('/', data=body, headers=HEADERS)
+        redelivered = self.client.post('/', data=body, headers=HEADERS)
+
+        self.assertEqual(rejected.status_code, 503)
+        self.assertEqual(redelivered.status_code, 200)
+        self.assertEqual(calls_for(chat_id), 1)
+
+    def test_unauthenticated_delivery_does_not_mark_update_seen(self):
+        update_id = chat_id = next_id()
+        body = update_body(update_id, chat_id, '/start')
+
+        forged = self.client.post('/', data=body, headers={'Content-Type': 'application/json'})
+        genuine = self.client.post('/', data=body, headers=HEADERS)
+
+        self.assertEqual(forged.status_code, 401)
+        self.assertEqual(genuine.status_code, 200)
+        self.assertEqual(calls_for(chat_id), 1)
+
+
+def sqlite_store(capacity, ttl, **options):
+    return index.SqliteDedupStore(os.path.join(tempfile.mkdtemp(), 'dedup.sqlite3'), capacity=capacity, ttl=ttl, **options)
+
+
+class DedupStoreContract:
+    """Behaviour every dedup backend must share; mixed into one TestCase per backend.
+
+    store_factory is set by each concrete TestCase and called with capacity and ttl.
+    """
+
+    store_factory = None
+
+    def make_store(self, capacity=100, ttl=60):
+        return self.store_factory(capacity=capacity, ttl=ttl)
+
+    def test_second_add_is_a_duplicate(self):
+        store = self.make_store()
+        self.assertTrue(store.add(1))
+        self.assertFalse(store.add(1))
+        self.assertEqual(store.duplicates, 1)
+
+    def test_discard_lets_the_update_through_again(self):
+        store = self.make_store()
+        store.add(1)
+        store.discard(1)
+        self.assertTrue(store.add(1))
+
+    def test_entries_expire_after_ttl(self):
+        store = self.make_store(ttl=0.05)
+        store.add(1)
+        time.sleep(0.1)
+        self.assertTrue(store.add(1))
+
+
+class MemoryDedupStoreTest(DedupStoreContract, unittest.TestCase):
+    store_factory = index.MemoryDedupStore
+
+    def test_oldest_entries_are_evicted_beyond_capacity(self):
+        store = self.make_store(capacity=2)
+        for update_id in (1, 2, 3):
+            store.add(update_id)
+        self.assertTrue(store.add(1))
+        self.assertFalse(store.add(3))
+
+
+class SqliteDedupStoreTest(DedupStoreContract, unittest.TestCase):
+    store_factory = staticmethod(sqlite_store)
+
+    def test_processes_sharing_the_file_see_each_other(self):
+        path = os.path.join(tempfile.mkdtemp(), 'dedup.sqlite3')
+        first = index.SqliteDedupStore(path, capacity=100, ttl=60)
+        second = index.SqliteDedupStore(path, capacity=100, ttl=60)
+        self.assertTrue(first.add(7))
+        self.assertFalse(second.add(7))
+
+    def test_oldest_entries_are_pruned_beyond_capacity(self):
+        store = sqlite_store(capacity=2, ttl=60, prune_every=1)
+        for update_id in (1, 2, 3):
+            store.add(update_id)
+            time.sleep(0.001)
+        self.assertTrue(store.add(1))
+        self.assertFalse(store.add(3))
+
+
+class DedupStoreConfigTest(unittest.TestCase):
+    def test_custom_factory_is_resolved_from_config(self):
+        factory = index.load_backend('index:MemoryDedupStore', {'memory': None})
+        self.assertIs(factory, index.MemoryDedupStore)
+
+
+if __name__ == '__main__':
+    unittest.main()
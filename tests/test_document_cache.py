@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from support import fake_api, index, next_id
+
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class FileIdStoreContract:
+    """Behaviour every file_id store must share; mixed into one TestCase per backend.
+
+    store_factory is set by each concrete TestCase and called with the store's path.
+    """
+
+    store_factory = None
+    file_name = None
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.store_path = os.path.join(directory, self.file_name)
+        self.document = os.path.join(directory, 'price.xlsx')
+        write_file(self.document, b'version 1')
+        self.cache = index.DocumentCache(self.store_factory(self.store_path))
+
+    def send(self):
+        return self.cache.send(next_id(), self.document)
+
+    def uploads_during(self, action):
+        """Run action; return how many files it uploaded and its result."""
+        uploads = len(fake_api.uploads)
+        result = action()
+        return len(fake_api.uploads) - uploads, result
+
+    def test_second_send_reuses_the_file_id(self):
+        first = self.send()
+        self.assertEqual(self.uploads_during(self.send)[0], 0)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.store.get(index.file_digest(self.document)), first.document.file_id)
+
+    def test_changed_file_is_uploaded_exactly_once(self):
+        self.send()
+        write_file(self.document, b'version 2, longer')
+
+        self.assertEqual(self.uploads_during(lambda: (self.send(), self.send()))[0], 1)
+        self.assertEqual(self.cache.uploads, 2)
+
+    def test_rejected_file_id_falls_back_to_one_upload(self):
+        self.send()
+        fake_api.fail_next(1, error_code=400)
+
+        uploaded, message = self.uploads_during(self.send)
+
+        self.assertEqual(uploaded, 1)
+        self.assertEqual(self.cache.store.get(index.file_digest(self.document)), message.document.file_id)
+
+    def test_file_ids_survive_a_new_instance(self):
+        first = self.send()
+        restarted = index.DocumentCache(self.store_factory(self.store_path))
+
+        self.assertEqual(self.uploads_during(lambda: restarted.send(next_id(), self.document))[0], 0)
+        self.assertEqual(restarted.store.get(index.file_digest(self.document)), first.document.file_id)
+
+
+class JsonFileIdStoreTest(FileIdStoreContract, unittest.TestCase):
+    store_factory = index.JsonFileIdStore
+    file_name = 'file_ids.json'
+
+
+class SqliteFileIdStoreTest(FileIdStoreContract, unittest.TestCase):
+    store_factory = index.SqliteFileIdStore
+    file_name = 'file_ids.sqlite3'
+
+
+if __name__ == '__main__':
+    unittest.main()
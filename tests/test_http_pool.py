@@ -0,0 +1,23 @@
+import threading
+import unittest
+
+from support import index, next_id
+
+
+class HttpPoolTest(unittest.TestCase):
+    def test_pool_keeps_a_connection_for_every_calling_thread(self):
+        def send():
+            for _ in range(5):
+                index.bot.send_message(next_id(), "hello")
+
+        # Request threads, queue workers and outbound threads all call at once.
+        threads = [threading.Thread(target=send) for _ in range(index.HTTP_POOL_SIZE)]
+        with self.assertNoLogs('urllib3.connectionpool', level='WARNING'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from support import HEADERS, index, next_id, update_body
+
+
+def make_sink(**options):
+    settings = {'batch_size': 20, 'flush_interval': 60, 'max_bytes': 1 << 20}
+    settings.update(options)
+    return index.LeadSink(os.path.join(tempfile.mkdtemp(), 'leads.jsonl'), **settings)
+
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+class LeadCaptureTest(unittest.TestCase):
+    def test_lead_is_on_disk_when_the_response_is_sent(self):
+        update_id = chat_id = next_id()
+        response = index.app.test_client().post('/', data=update_body(update_id, chat_id, 'payment_sbp'), headers=HEADERS)
+
+        self.assertEqual(response.status_code, 200)
+        leads = [lead for lead in read_lines(index.lead_sink.path) if lead['chat_id'] == chat_id]
+        self.assertEqual([lead['payment_method'] for lead in leads], ['sbp'])
+
+
+    def test_updates_without_leads_do_not_flush(self):
+        with mock.patch.object(index.lead_sink, 'flush', wraps=index.lead_sink.flush) as flush:
+            index.app.test_client().post('/', data=update_body(next_id(), next_id(), '/start'), headers=HEADERS)
+            index.app.test_client().post('/', data=update_body(next_id(), next_id(), 'video_menu'), headers=HEADERS)
+            self.assertEqual(flush.call_count, 0)
+            index.app.test_client().post('/', data=update_body(next_id(), next_id(), 'payment_card'), headers=HEADERS)
+            self.assertEqual(flush.call_count, 1)
+
+
+class LeadSinkTest(unittest.TestCase):
+    def test_without_background_flushing_no_timer_is_started(self):
+        sink = make_sink()
+        sink.append({'id': 1, 'chat_id': 1, 'ts': 1})
+        self.assertIsNone(sink._timer)
+        self.assertFalse(os.path.exists(sink.path))
+        sink.flush()
+        self.assertEqual(len(read_lines(sink.path)), 1)
+
+    def test_full_batch_is_written_at_once(self):
+        sink = make_sink(batch_size=2)
+        sink.append({'id': 1, 'chat_id': 1, 'ts': 1})
+        sink.append({'id': 2, 'chat_id': 1, 'ts': 2})
+        self.assertEqual(sink.flushes, 1)
+        self.assertEqual(len(read_lines(sink.path)), 2)
+
+    def test_rotations_in_the_same_millisecond_keep_every_segment(self):
+        sink = make_sink(batch_size=1, max_bytes=1)
+        with mock.patch.object(index.time, 'time', return_value=1700000000.0):
+            for n in range(3):
+                sink.append({'id': n, 'chat_id': 7, 'ts': n})
+
+        self.assertEqual(len(sink.segments()), 4)
+        self.assertEqual([lead['id'] for lead in sink.for_chat(7)], [0, 1, 2])
+
+    def test_torn_last_line_is_truncated_before_the_next_write(self):
+        sink = make_sink()
+        with open(sink.path, 'wb') as f:
+            f.write(b'{"id": 1, "chat_id": 5, "ts": 1}\n{"id": 2, "chat')
+        sink.append({'id': 3, 'chat_id': 5, 'ts': 3})
+        sink.flush()
+        self.assertEqual([lead['id'] for lead in read_lines(sink.path)], [1, 3])
+
+    def test_index_answers_by_chat_and_by_time(self):
+        sink = make_sink(batch_size=1, max_bytes=64)
+        for n in range(6):
+            sink.append({'id': n, 'chat_id': n % 2, 'ts': 100 + n})
+
+        self.assertEqual([lead['id'] for lead in sink.for_chat(1)], [1, 3, 5])
+        self.assertEqual([lead['id'] for lead in sink.since(104)], [4, 5])
+        sink.compact()
+        self.assertEqual([lead['id'] for lead in sink.for_chat(0)], [0, 2, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
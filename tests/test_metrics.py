@@ -0,0 +1,69 @@
+import unittest
+from unittest import mock
+
+from support import HEADERS, index, next_id, update_body
+
+
+def series(metrics, name, labels=''):
+    """Values of the bucket, sum and count lines of one histogram series in a scrape."""
+    lines = dict(line.rsplit(' ', 1) for line in metrics.splitlines() if line and not line.startswith('#'))
+    label_prefix = labels + ',' if labels else ''
+    suffix = '{' + labels + '}' if labels else ''
+    buckets = [(key, float(value)) for key, value in lines.items() if key.startswith(f'{name}_bucket{{{label_prefix}le=')]
+    return buckets, float(lines[f'{name}_sum{suffix}']), float(lines[f'{name}_count{suffix}'])
+
+
+class HistogramTest(unittest.TestCase):
+    def test_buckets_are_cumulative_and_end_with_inf(self):
+        histogram = index.Histogram('test_seconds', 'Test.', label='route', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value, 'a')
+
+        buckets, total, count = series("\n".join(histogram.render()), 'test_seconds', 'route="a"')
+
+        self.assertEqual(buckets, [
+            ('test_seconds_bucket{route="a",le="0.1"}', 1),
+            ('test_seconds_bucket{route="a",le="1.0"}', 3),
+            ('test_seconds_bucket{route="a",le="+Inf"}', 4),
+        ])
+        self.assertAlmostEqual(total, 6.05)
+        self.assertEqual(count, 4)
+
+
+class MetricsEndpointTest(unittest.TestCase):
+    def setUp(self):
+        self.client = index.app.test_client()
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(as_text=True)
+
+    def test_update_is_reflected_in_the_scrape(self):
+        before = series(self.scrape(), 'bot_update_duration_seconds')[2]
+        self.client.post('/', data=update_body(next_id(), next_id(), 'video_menu'), headers=HEADERS)
+        metrics = self.scrape()
+
+        buckets, total, count = series(metrics, 'bot_update_duration_seconds')
+        self.assertEqual(count, before + 1)
+        self.assertGreater(total, 0)
+        self.assertTrue(buckets[-1][0].endswith('le="+Inf"}'))
+        self.assertEqual(buckets[-1][1], count)
+        self.assertEqual([value for _, value in buckets], sorted(value for _, value in buckets))
+
+        route_buckets, _, route_count = series(metrics, 'bot_callback_route_duration_seconds', 'route="video_menu"')
+        self.assertGreaterEqual(route_count, 1)
+        self.assertEqual(route_buckets[-1][1], route_count)
+
+    def test_failure_before_routing_is_labelled_unknown(self):
+        with mock.patch.object(index.content, 'due', return_value=True), \
+                mock.patch.object(index.content, 'refresh', side_effect=OSError("disk gone")):
+            self.client.post('/', data=update_body(next_id(), next_id(), 'video_menu'), headers=HEADERS)
+
+        metrics = self.scrape()
+        self.assertNotIn('route="None"', metrics)
+        self.assertIn('bot_callback_route_duration_seconds_count{route="unknown"}', metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
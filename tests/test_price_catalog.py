@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import unittest
+
+import openpyxl
+
+from support import index
+
+# Telegram's limit on buttons in one inline keyboard row.
+MAX_ROW_BUTTONS = 8
+
+
+def button_texts(screen):
+    return [button['text'] for row in json.loads(screen.reply_markup)['inline_keyboard'] for button in row]
+
+
+def write_workbook(rows):
+    path = os.path.join(tempfile.mkdtemp(), 'price.xlsx')
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(('Услуга', 'Стоимость, руб.', 'Категория'))
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+class PriceCatalogTest(unittest.TestCase):
+    def build(self, rows, page_size=8):
+        catalog = index.PriceCatalog(write_workbook(rows), page_size=page_size)
+        catalog.refresh(index.content.labels)
+        return catalog
+
+    def test_many_categories_stay_within_telegram_row_limit(self):
+        catalog = self.build([(f'Услуга {i}', 1000 + i, f'Категория {i}') for i in range(20)])
+        keyboard = json.loads(catalog.page(1).reply_markup)['inline_keyboard']
+
+        self.assertTrue(all(len(row) <= MAX_ROW_BUTTONS for row in keyboard))
+        category_buttons = [button for row in keyboard for button in row if button['callback_data'].startswith('price_cat_')]
+        self.assertEqual(len(category_buttons), 20)
+
+    def test_pages_items_and_categories(self):
+        catalog = self.build([(f'Услуга {i}', 1500, 'Очно' if i % 2 else 'Онлайн') for i in range(10)], page_size=4)
+
+        self.assertIn('(стр. 3/3)', catalog.page(99).text)
+        self.assertEqual(catalog.item(0).text, "💰 Услуга 0\nСтоимость: 1 500 руб.")
+        self.assertEqual(catalog.categories, ('Онлайн', 'Очно'))
+        self.assertIsNone(catalog.category(5))
+
+    def test_long_category_is_split_into_pages_within_telegram_text_limit(self):
+        rows = [(f'Консультация специалиста, вариант {i}', 1500 + i, 'Очно') for i in range(300)]
+        catalog = self.build(rows)
+
+        pages = []
+        screen = catalog.category(0)
+        while True:
+            pages.append(screen)
+            self.assertLessEqual(len(screen.text), 4096)
+            callbacks = [button['callback_data'] for row in json.loads(screen.reply_markup)['inline_keyboard'] for button in row]
+            following = f'price_cat_0_{len(pages) + 1}'
+            if following not in callbacks:
+                break
+            screen = catalog.category(0, len(pages) + 1)
+
+        self.assertGreater(len(pages), 1)
+        self.assertIn(f'(стр. 1/{len(pages)})', pages[0].text)
+        listed = [line for page in pages for line in page.text.split('\n')[1:]]
+        self.assertEqual(len(listed), len(rows))
+        # Out-of-range pages clamp like page() does.
+        self.assertIs(catalog.category(0, 99), pages[-1])
+
+    def test_button_labels_come_from_the_content_catalog(self):
+        catalog = self.build([('Услуга', 1500, 'Онлайн')])
+        self.assertIn(index.content.labels['price_request'], button_texts(catalog.item(0)))
+
+        labels = index.MappingProxyType({**index.content.labels, 'price_request': 'Записаться'})
+        items = catalog.items
+        catalog.refresh(labels)
+
+        self.assertIn('Записаться', button_texts(catalog.item(0)))
+        # Only the screens are re-rendered; the workbook is not parsed again.
+        self.assertIs(catalog.items, items)
+        self.assertEqual(catalog.builds, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import asyncio
+import contextvars
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import telebot
+
+from support import HEADERS, calls_for, fake_api, index, next_id, update_body
+
+
+def rate_limited(retry_after):
+    return telebot.apihelper.ApiTelegramException('sendMessage', None, {
+        'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+        'parameters': {'retry_after': retry_after},
+    })
+
+
+class RetryAfterTest(unittest.TestCase):
+    def test_backoff_doubles_retry_after_and_is_capped(self):
+        scheduler = index.SendScheduler(1000, 1000, 1000, max_retries=4, max_retry_after=10)
+        error = rate_limited(2)
+        self.assertEqual([scheduler._retry_delay(error, attempt) for attempt in range(4)], [2, 4, 8, 10])
+        self.assertIsNone(scheduler._retry_delay(error, 4))
+
+    def test_other_errors_are_not_retried(self):
+        scheduler = index.SendScheduler(1000, 1000, 1000, max_retries=3, max_retry_after=10)
+        error = telebot.apihelper.ApiTelegramException('sendMessage', None, {'ok': False, 'error_code': 400, 'description': 'Bad Request'})
+        self.assertIsNone(scheduler._retry_delay(error, 0))
+
+    def test_429_from_the_api_is_retried_until_it_succeeds(self):
+        chat_id = next_id()
+        retries = index.send_scheduler.retries
+        fake_api.fail_next(2, error_code=429, retry_after=1)
+
+        start_time = time.perf_counter()
+        message = index.bot.send_message(chat_id, "hello")
+        elapsed = time.perf_counter() - start_time
+
+        self.assertEqual(message.chat.id, chat_id)
+        self.assertEqual(calls_for(chat_id), 3)
+        self.assertEqual(index.send_scheduler.retries, retries + 2)
+        # Both waits are capped at RATE_LIMIT_MAX_RETRY_AFTER (0.05 s in tests).
+        self.assertGreaterEqual(elapsed, 2 * index.send_scheduler.max_retry_after)
+
+    def test_429_on_an_upload_resends_the_whole_file(self):
+        chat_id = next_id()
+        size = os.path.getsize(index.PRICE_FILE_PATH)
+        uploads = len(fake_api.uploads)
+        cache = index.DocumentCache(index.JsonFileIdStore(os.path.join(tempfile.mkdtemp(), 'file_ids.json')))
+        fake_api.fail_next(1, error_code=429)
+
+        message = cache.send(chat_id, index.PRICE_FILE_PATH)
+
+        self.assertEqual(fake_api.uploads[uploads:], [size, size])
+        self.assertEqual(cache.store.get(index.file_digest(index.PRICE_FILE_PATH)), message.document.file_id)
+
+    def test_429_is_raised_once_retries_are_exhausted(self):
+        chat_id = next_id()
+        fake_api.fail_next(index.send_scheduler.max_retries + 1, error_code=429)
+
+        with self.assertRaises(telebot.apihelper.ApiTelegramException) as raised:
+            index.bot.send_message(chat_id, "hello")
+
+        self.assertEqual(raised.exception.error_code, 429)
+        self.assertEqual(calls_for(chat_id), index.send_scheduler.max_retries + 1)
+
+
+class CoalescingTest(unittest.TestCase):
+    def click(self, scheduler, chat_id):
+        """Start rendering a screen in its own context, as a separate update would."""
+        context = contextvars.copy_context()
+        token = context.run(scheduler.begin, chat_id)
+        return context, token
+
+    def test_only_the_latest_click_is_sent(self):
+        scheduler = index.SendScheduler(1000, 1000, 1000, max_retries=0, max_retry_after=1)
+        first, _ = self.click(scheduler, 1)
+        latest, _ = self.click(scheduler, 1)
+
+        with self.assertRaises(index.Superseded):
+            first.run(scheduler.call, lambda: 'sent', 1)
+        self.assertEqual(latest.run(scheduler.call, lambda: 'sent', 1), 'sent')
+        # Calls for other chats are never held back by this chat's clicks.
+        self.assertEqual(first.run(scheduler.call, lambda: 'sent', 2), 'sent')
+
+    def test_stale_click_stays_superseded_after_newer_clicks_finish(self):
+        scheduler = index.SendScheduler(1000, 1000, 1000, max_retries=0, max_retry_after=1)
+        stale, _ = self.click(scheduler, 1)
+        finished, token = self.click(scheduler, 1)
+        finished.run(scheduler.end, token)
+        self.click(scheduler, 1)
+
+        with self.assertRaises(index.Superseded):
+            stale.run(scheduler.call, lambda: 'sent', 1)
+
+    def test_evicted_chat_never_reuses_a_generation(self):
+        scheduler = index.SendScheduler(1000, 1000, 1000, max_retries=0, max_retry_after=1, max_chats=1)
+        stale, _ = self.click(scheduler, 1)
+        self.click(scheduler, 2)
+        latest, _ = self.click(scheduler, 1)
+
+        with self.assertRaises(index.Superseded):
+            stale.run(scheduler.call, lambda: 'sent', 1)
+        self.assertEqual(latest.run(scheduler.call, lambda: 'sent', 1), 'sent')
+
+    def test_superseded_clicks_do_not_delay_the_latest(self):
+        scheduler = index.SendScheduler(1000, 10, 1, max_retries=0, max_retry_after=1)
+        scheduler.call(lambda: 'sent', 1)  # Uses up the chat's burst: the next token is 0.1 s away.
+        results = {}
+
+        def click(n):
+            scheduler.begin(1)
+            start_time = time.perf_counter()
+            try:
+                outcome = scheduler.call(lambda: 'sent', 1)
+            except index.Superseded:
+                outcome = 'superseded'
+            results[n] = (outcome, time.perf_counter() - start_time)
+
+        threads = []
+        for n in range(4):
+            threads.append(threading.Thread(target=click, args=(n,)))
+            threads[-1].start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([results[n][0] for n in range(4)], ['superseded'] * 3 + ['sent'])
+        # Dropped clicks leave as soon as they are replaced and take no tokens, so the
+        # latest screen goes out with the next token instead of queueing behind them.
+        self.assertLess(max(elapsed for _, elapsed in results.values()), 0.15)
+        self.assertEqual(scheduler._waiters, {})
+
+    def test_async_calls_are_woken_when_superseded(self):
+        scheduler = index.SendScheduler(1000, 1, 1, max_retries=0, max_retry_after=1)
+
+        async def send():
+            return 'sent'
+
+        async def click():
+            scheduler.begin(1)
+            try:
+                return await scheduler.acall(send, 1, Exception)
+            except index.Superseded:
+                return 'superseded'
+
+        async def main():
+            await scheduler.acall(send, 1, Exception)  # Uses up the chat's burst.
+            stale = asyncio.ensure_future(click())
+            await asyncio.sleep(0.01)
+            latest = asyncio.ensure_future(click())
+            start_time = time.perf_counter()
+            result = await stale
+            elapsed = time.perf_counter() - start_time
+            latest.cancel()
+            return result, elapsed
+
+        result, elapsed = asyncio.run(main())
+        self.assertEqual(result, 'superseded')
+        # Woken by the newer click instead of sleeping out the 1 s refill.
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(scheduler._waiters, {})
+
+    def test_rapid_clicks_through_the_webhook_send_at_most_two_screens(self):
+        chat_id = next_id()
+        clicks = 5
+        chat_rate = 2
+        edits = fake_api.calls_by_method['editMessageText']
+        coalesced = index.send_scheduler.coalesced
+
+        def post(route):
+            index.app.test_client().post('/', data=update_body(next_id(), chat_id, route), headers=HEADERS)
+
+        # One token per chat and a slow refill: every click after the first waits, and
+        # while it waits newer clicks supersede it.
+        with mock.patch.object(index.send_scheduler, 'chat_rate', chat_rate), mock.patch.object(index.send_scheduler, 'chat_burst', 1):
+            start_time = time.perf_counter()
+            threads = [threading.Thread(target=post, args=(route,)) for route in ('video_menu', 'faq_menu') * 2 + ('reviews_menu',)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start_time
+
+        sent = fake_api.calls_by_method['editMessageText'] - edits
+        dropped = index.send_scheduler.coalesced - coalesced
+        self.assertEqual(sent + dropped, clicks)
+        self.assertLessEqual(sent, 2)
+        # The latest screen waits for one token, not for one per dropped click.
+        self.assertLess(elapsed, 2 / chat_rate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from support import HEADERS, fake_api, index, next_id, update_body
+
+
+class WebhookStateTest(unittest.TestCase):
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.state = index.webhook_state
+
+    def post_update(self):
+        update_id = chat_id = next_id()
+        return self.client.post('/', data=update_body(update_id, chat_id, 'video_menu'), headers=HEADERS)
+
+    def test_deliveries_count_as_skipped_checks(self):
+        self.post_update()
+        checks = fake_api.calls_by_method['getWebhookInfo']
+        skipped, confirmed = self.state.skipped, self.state.confirmed
+        self.post_update()
+        self.post_update()
+
+        self.assertEqual(fake_api.calls_by_method['getWebhookInfo'], checks)
+        self.assertEqual(self.state.confirmed, confirmed + 2)
+        # Cache hits stay a separate count, so deliveries are not counted twice.
+        self.assertEqual(self.state.skipped, skipped)
+        metrics = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn(f'bot_webhook_checks_skipped_total{{source="delivery"}} {self.state.confirmed}', metrics)
+
+    def test_delivery_does_not_cancel_signalled_drift(self):
+        self.post_update()
+        checks = fake_api.calls_by_method['getWebhookInfo']
+
+        self.state.invalidate("test")
+        self.assertFalse(self.state.confirm())
+        self.post_update()
+        self.post_update()
+
+        # Exactly one real check: the first delivery after the drift signal, none after it.
+        self.assertEqual(fake_api.calls_by_method['getWebhookInfo'], checks + 1)
+        self.assertTrue(self.state.confirm())
+
+
+if __name__ == '__main__':
+    unittest.main()